@@ -0,0 +1,286 @@
+"""Headless load test: many phones playing many games at once against a real MongoDB.
+
+Every simulated device is a thread running a weighted mix of the actions a phone
+performs, through the same code paths the app uses: location updates (zone
+lookup plus the rerun's snapshot read), deposits (the Confirm Deposit write),
+challenge completions, card draws, and playing and clearing curses. The report
+is JSON with p50/p95/p99 latency, throughput and error, rejection and
+exhaustion rates per action. "exhausted" means the team had nothing to act on:
+an empty deck, every challenge completed, no curse card in hand or no curse to
+clear. The device then refills the deck or resets the completed challenges, so
+later iterations keep exercising the writes. "rejected" means the write's guard
+turned it down: another device on the team got there first (the challenge or the
+curse card was taken between the read and the write), or the state forbids it
+(no draws during a gold rush).
+
+Run from the repository root against a local mongod started as a single-node
+replica set, as playing and clearing curses run in transactions (it writes to its
+own database and drops what it created unless --keep is given):
+
+    python benchmarks/load_test.py --games 4 --devices-per-team 5 --duration 30 --output load.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import pymongo
+
+sys.path.insert(0, os.getcwd())
+import events  # noqa: E402
+import game_actions  # noqa: E402
+import games  # noqa: E402
+import notifications  # noqa: E402
+from cards import new_deck  # noqa: E402
+from challenges import CHALLENGES  # noqa: E402
+from snapshot import BUMP_VERSION, TEAMS, load_snapshot  # noqa: E402
+from zones import get_zone_store  # noqa: E402
+
+DEFAULT_MIX = {
+    "location_update": 50,
+    "deposit": 20,
+    "draw_card": 10,
+    "play_curse": 8,
+    "clear_curse": 7,
+    "complete_challenge": 5,
+}
+STARTING_BALANCE = 1_000_000  # enough that the balance never runs out during a run
+
+
+class Device:
+    """One phone: a team in a game, with its own random stream."""
+
+    def __init__(self, db, game_id, team, seed, zone_store):
+        self.collection = db[game_id]
+        self.game_id = game_id
+        self.team = team
+        self.other_team = TEAMS[1 - TEAMS.index(team)]
+        self.rng = random.Random(seed)
+        self.zone_store = zone_store
+
+    def location_update(self):
+        min_lon, min_lat, max_lon, max_lat = self.zone_store.total_bounds
+        self.zone_store.locate(self.rng.uniform(min_lat, max_lat), self.rng.uniform(min_lon, max_lon))
+        load_snapshot(self.collection, team=self.team)
+        return "ok"
+
+    def deposit(self):
+        _, error = game_actions.deposit(
+            self.collection, self.team, self.rng.randint(1, 9), self.rng.randint(10, 100), uuid.uuid4().hex
+        )
+        return "rejected" if error else "ok"
+
+    def draw_card(self):
+        _, error = game_actions.draw_card(self.collection, self.game_id, self.team)
+        if error is None:
+            return "ok"
+        # Only the device that finds the deck empty first deals a new one, shuffled with the game's stored salt
+        doc = self.collection.find_one({"_id": self.team}, {"deck_salt": 1})
+        deck = new_deck(game_actions.deck_seed(self.game_id, self.team, doc["deck_salt"]))
+        refilled = self.collection.update_one(
+            {"_id": self.team, "deck.0": {"$exists": False}}, {"$set": {"deck": deck}, "$inc": BUMP_VERSION}
+        )
+        return "exhausted" if refilled.modified_count else "rejected"
+
+    def play_curse(self):
+        doc = self.collection.find_one({"_id": self.team}, {"hand": 1})
+        curses = [card for card in doc.get("hand", []) if "curse" in card["type"]]
+        if not curses:
+            return "exhausted"
+        card = self.rng.choice(curses)
+        value = self.rng.randint(1, 50) if card["type"] == "curse_with_input" else None
+        sent = game_actions.send_curse(self.collection, self.team, self.other_team, card, game_actions.build_curse(card, value))
+        return "ok" if sent else "rejected"
+
+    def clear_curse(self):
+        doc = self.collection.find_one({"_id": self.team}, {"active_curses": 1})
+        if not doc.get("active_curses"):
+            return "exhausted"
+        curse = self.rng.choice(doc["active_curses"])
+        game_actions.clear_curse(
+            self.collection, self.team, self.other_team, curse, f"The {self.team} team has cleared the curse: {curse['title']}"
+        )
+        return "ok"
+
+    def complete_challenge(self):
+        # A phone only offers the challenges its team hasn't done
+        doc = self.collection.find_one({"_id": self.team}, {"completed_challenges": 1})
+        completed = set(doc.get("completed_challenges", []))
+        remaining = [challenge for challenge in CHALLENGES if challenge["id"] not in completed]
+        if not remaining:
+            self.collection.update_one({"_id": self.team}, {"$set": {"completed_challenges": []}, "$inc": BUMP_VERSION})
+            return "exhausted"
+        _, error = game_actions.complete_challenge(self.collection, self.team, self.rng.choice(remaining))
+        return "rejected" if error else "ok"
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_load_test(db, n_games, devices_per_team, duration, mix=DEFAULT_MIX, think_time=0.0, seed=0):
+    """Provisions n_games games, plays them from every device for duration seconds and returns the report."""
+    run_id = uuid.uuid4().hex[:8]
+    game_ids = [f"load-{run_id}-{n}" for n in range(1, n_games + 1)]
+    games.provision_games(db, game_ids, session=f"load-{run_id}")
+    for game_id in game_ids:
+        db[game_id].update_many({}, {"$set": {"balance": STARTING_BALANCE}, "$inc": BUMP_VERSION})
+
+    zone_store = get_zone_store()
+    devices = [
+        Device(db, game_id, team, seed * 1_000_003 + index, zone_store)
+        for index, (game_id, team) in enumerate(
+            (game_id, team) for game_id in game_ids for team in TEAMS for _ in range(devices_per_team)
+        )
+    ]
+    actions, weights = list(mix), list(mix.values())
+
+    latencies = defaultdict(list)
+    outcomes = defaultdict(Counter)
+    error_messages = Counter()
+    results_lock = threading.Lock()
+    start_barrier = threading.Barrier(len(devices) + 1)
+
+    def play(device):
+        local_latencies = defaultdict(list)
+        local_outcomes = defaultdict(Counter)
+        local_errors = Counter()
+        start_barrier.wait()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            action = device.rng.choices(actions, weights)[0]
+            started = time.perf_counter()
+            try:
+                outcome = getattr(device, action)()
+            except pymongo.errors.PyMongoError as e:
+                outcome = "error"
+                local_errors[f"{action}: {type(e).__name__}: {e}"[:200]] += 1
+            local_latencies[action].append(time.perf_counter() - started)
+            local_outcomes[action][outcome] += 1
+            if think_time:
+                time.sleep(device.rng.expovariate(1 / think_time))
+        with results_lock:
+            for action, values in local_latencies.items():
+                latencies[action].extend(values)
+            for action, counts in local_outcomes.items():
+                outcomes[action].update(counts)
+            error_messages.update(local_errors)
+
+    threads = [threading.Thread(target=play, args=(device,), daemon=True) for device in devices]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    report_actions = {}
+    for action in actions:
+        values = sorted(latencies[action])
+        counts = outcomes[action]
+        total = sum(counts.values())
+        report_actions[action] = {
+            "count": total,
+            "ok": counts["ok"],
+            "rejected": counts["rejected"],
+            "exhausted": counts["exhausted"],
+            "errors": counts["error"],
+            "rejection_rate": counts["rejected"] / total if total else 0.0,
+            "exhaustion_rate": counts["exhausted"] / total if total else 0.0,
+            "error_rate": counts["error"] / total if total else 0.0,
+            "throughput_per_s": total / elapsed,
+            "latency_ms": {
+                "p50": _ms(percentile(values, 50)),
+                "p95": _ms(percentile(values, 95)),
+                "p99": _ms(percentile(values, 99)),
+                "max": _ms(values[-1] if values else None),
+                "mean": _ms(sum(values) / len(values) if values else None),
+            },
+        }
+    total_actions = sum(action["count"] for action in report_actions.values())
+    return {
+        "config": {
+            "games": n_games,
+            "teams_per_game": len(TEAMS),
+            "devices_per_team": devices_per_team,
+            "devices": len(devices),
+            "duration_s": duration,
+            "think_time_s": think_time,
+            "mix": mix,
+            "seed": seed,
+            "event_log": events.EVENT_LOG_ENABLED,
+        },
+        "game_ids": game_ids,
+        "elapsed_s": elapsed,
+        "total_actions": total_actions,
+        "throughput_per_s": total_actions / elapsed,
+        "error_rate": sum(action["errors"] for action in report_actions.values()) / total_actions if total_actions else 0.0,
+        "actions": report_actions,
+        "top_errors": dict(error_messages.most_common(10)),
+    }
+
+
+def drop_games(db, game_ids):
+    """Removes everything a load test run created."""
+    for game_id in game_ids:
+        db.drop_collection(game_id)
+    db[games.REGISTRY_COLLECTION].delete_many({"_id": {"$in": game_ids}})
+    db[events.EVENTS_COLLECTION].delete_many({"game": {"$in": game_ids}})
+    db[events.SNAPSHOTS_COLLECTION].delete_many({"game": {"$in": game_ids}})
+    db[notifications.NOTIFICATIONS_COLLECTION].delete_many({"game": {"$in": game_ids}})
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1e3, 3)
+
+
+def _parse_mix(text):
+    mix = dict(DEFAULT_MIX)
+    for part in filter(None, text.split(",")):
+        action, _, weight = part.partition("=")
+        if action not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown action {action!r} (choose from {', '.join(DEFAULT_MIX)})")
+        mix[action] = float(weight)
+    return {action: weight for action, weight in mix.items() if weight > 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the game's write and read paths against MongoDB.")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--database", default="ottawa-game-loadtest")
+    parser.add_argument("--games", type=int, default=4)
+    parser.add_argument("--devices-per-team", type=int, default=5)
+    parser.add_argument("--duration", type=float, default=30, help="seconds each device keeps playing")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean seconds a device waits between actions")
+    parser.add_argument("--mix", type=_parse_mix, default=DEFAULT_MIX, help="weights, e.g. deposit=40,draw_card=0")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--keep", action="store_true", help="keep the games afterwards instead of dropping them")
+    args = parser.parse_args()
+
+    # Same client settings as the app, minus the health monitor
+    client = pymongo.MongoClient(args.mongo_url, compressors="zlib", appname="ottawa-game-loadtest", retryWrites=True, w="majority")
+    db = client[args.database]
+    report = run_load_test(db, args.games, args.devices_per_team, args.duration, args.mix, args.think_time, args.seed)
+    if not args.keep:
+        drop_games(db, report["game_ids"])
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
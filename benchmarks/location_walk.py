@@ -0,0 +1,111 @@
+"""Replays simulated walks through the zones against the location stream's reporting rules.
+
+Each walker heads for random points around the zones at walking speed and gets
+one GPS fix a second with --noise metres of error. The fixes go through the
+same rules as components/location_stream: a trailing debounce of DEBOUNCE_MS,
+and a report (one rerun) only once a fix is more than the threshold from the
+last one reported. The threshold comes from movement_threshold() with
+ZoneStore.stable_distance() at the last reported position, as in the app.
+
+It prints how many reruns that took and, for each second, whether the zone
+the page showed matched the zone of the newest fix, which is what a rerun on
+every fix would show:
+
+    python benchmarks/location_walk.py --walkers 4 --minutes 60 --noise 4
+"""
+import argparse
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.getcwd())
+from location_stream import DEBOUNCE_MS, movement_threshold  # noqa: E402
+from zones import METRES_PER_DEGREE_LAT, get_zone_store  # noqa: E402
+
+WALKING_SPEED = 1.4  # metres per second
+MARGIN = 200  # metres around the zones' bounding box the walkers also wander into
+
+
+def metres_between(a, b):
+    """Haversine distance, as the component measures it."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6_371_000 * math.asin(math.sqrt(h))
+
+
+def walk(zone_store, seconds, noise, rng):
+    """One fix a second as (true (lat, lon), fix (lat, lon)) for a walker roaming the play area."""
+    min_lon, min_lat, max_lon, max_lat = zone_store.total_bounds
+    metres_per_lon = METRES_PER_DEGREE_LAT * math.cos(math.radians((min_lat + max_lat) / 2))
+    lat_margin, lon_margin = MARGIN / METRES_PER_DEGREE_LAT, MARGIN / metres_per_lon
+
+    def waypoint():
+        return rng.uniform(min_lat - lat_margin, max_lat + lat_margin), rng.uniform(min_lon - lon_margin, max_lon + lon_margin)
+
+    position, target = waypoint(), waypoint()
+    for _ in range(seconds):
+        dy = (target[0] - position[0]) * METRES_PER_DEGREE_LAT
+        dx = (target[1] - position[1]) * metres_per_lon
+        distance = math.hypot(dx, dy)
+        if distance <= WALKING_SPEED:
+            position, target = target, waypoint()
+        else:
+            step = WALKING_SPEED / distance
+            position = (position[0] + dy * step / METRES_PER_DEGREE_LAT, position[1] + dx * step / metres_per_lon)
+        fix = (
+            position[0] + rng.gauss(0, noise) / METRES_PER_DEGREE_LAT,
+            position[1] + rng.gauss(0, noise) / metres_per_lon,
+        )
+        yield position, fix
+
+
+def replay(zone_store, fixes):
+    """Runs fixes through the component's rules; returns (reruns, seconds the shown zone was stale)."""
+    debounce = DEBOUNCE_MS / 1000
+    last_sent, last_sent_at, threshold = None, -math.inf, None
+    shown_zone, stale_seconds, reruns = None, 0, 0
+    pending, flush_at = None, None
+
+    for second, (_, fix) in enumerate(fixes):
+        pending = fix
+        if flush_at is None:
+            flush_at = max(second, last_sent_at + debounce)
+        if flush_at <= second:
+            # The debounce timer fires once per second at most here, as fixes come once a second
+            flush_at = None
+            if last_sent is None or metres_between(last_sent, pending) > threshold:
+                last_sent, last_sent_at = pending, second
+                # The rerun: locate the zone and hand the component its next threshold
+                shown_zone, _ = zone_store.locate(*last_sent)
+                threshold = movement_threshold(zone_store.stable_distance(*last_sent))
+                reruns += 1
+            pending = None
+        if shown_zone != zone_store.locate(*fix)[0]:
+            stale_seconds += 1
+    return reruns, stale_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count reruns and zone lag for simulated walks.")
+    parser.add_argument("--walkers", type=int, default=4)
+    parser.add_argument("--minutes", type=float, default=60, help="how long each walker walks")
+    parser.add_argument("--noise", type=float, default=4, help="standard deviation of GPS error in metres, per axis")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    zone_store = get_zone_store()
+    rng = random.Random(args.seed)
+    seconds = int(args.minutes * 60)
+    total_reruns = total_stale = 0
+    for walker in range(1, args.walkers + 1):
+        reruns, stale = replay(zone_store, walk(zone_store, seconds, args.noise, rng))
+        total_reruns += reruns
+        total_stale += stale
+        print(f"walker {walker}: {seconds} fixes, {reruns:5d} reruns, shown zone stale for {stale:4d} s")
+    fixes = seconds * args.walkers
+    print(f"total:    {fixes} fixes, {total_reruns:5d} reruns ({total_reruns / fixes:.1%} of fixes), stale for {total_stale} s ({total_stale / fixes:.2%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Benchmark for building and serializing the game map.
+
+Compares one folium element per polygon, marker and popup (how the map used to
+be built) with map_view.build_map, both pushed through st_folium's
+serialization. The Streamlit component call itself is stubbed out.
+Run from the repository root: python benchmarks/map_build.py
+"""
+import os
+import sys
+import timeit
+
+import folium
+import streamlit_folium
+
+sys.path.insert(0, os.getcwd())
+from challenges import CHALLENGES  # noqa: E402
+from map_view import CENTRE, TILE_ATTRIBUTION, TILE_URL, build_map, challenge_popup_html, trophy_colour  # noqa: E402
+from zones import get_zone_store  # noqa: E402
+
+USER_LOCATION = (45.4245, -75.6990)
+
+
+def build_per_element_map(zone_store):
+    m = folium.Map(min_zoom=5, location=[CENTRE["lat"], CENTRE["lon"]], zoom_start=14)
+    folium.Marker(
+        location=list(USER_LOCATION),
+        icon=folium.DivIcon(html='<i class="fa fa-location-crosshairs"></i>', icon_size=(25, 25), icon_anchor=(12.5, 12.5)),
+    ).add_to(m)
+    for zone_number in zone_store:
+        folium.Polygon(
+            locations=zone_store.leaflet_coords[zone_number],
+            color="#FF4B4B",
+            fill=True,
+            fill_opacity=0.3,
+            weight=3,
+            popup=folium.Popup(f"<div>Zone {zone_number}</div>", max_width=200),
+        ).add_to(m)
+    for challenge in CHALLENGES:
+        folium.Marker(
+            location=[challenge["lat"], challenge["lon"]],
+            icon=folium.DivIcon(
+                html=f'<i class="fa-solid fa-trophy" style="color: #{trophy_colour(challenge["points"])};"></i>',
+                icon_size=(24, 16),
+                icon_anchor=(12, 8),
+            ),
+            popup=folium.Popup(challenge_popup_html(challenge), max_width=300),
+        ).add_to(m)
+    folium.TileLayer(tiles=TILE_URL + "key", attr=TILE_ATTRIBUTION, api_key="key", min_zoom=13, max_zoom=21).add_to(m)
+    return m
+
+
+def build_cached_map(zone_store, mode):
+    return build_map(zone_store, None, None, None, [challenge["id"] for challenge in CHALLENGES], TILE_URL + "key", USER_LOCATION, mode=mode)
+
+
+def main():
+    streamlit_folium._component_func = lambda **kwargs: kwargs["default"]
+    zone_store = get_zone_store()
+
+    n = 20
+    old = timeit.timeit(lambda: streamlit_folium.st_folium(build_per_element_map(zone_store), height=400, width=None), number=n) / n
+    print(f"{'per-element map:':21}{old * 1e3:8.1f} ms/rerun")
+    for mode in ("layers", "geojson"):
+        new = timeit.timeit(lambda: streamlit_folium.st_folium(build_cached_map(zone_store, mode), height=400, width=None, render=False), number=n) / n
+        print(f"{f'build_map ({mode}):':21}{new * 1e3:8.1f} ms/rerun ({old / new:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""End-to-end timings of one rerun of ottawa_game.py in each UI state, with a regression check.
+
+Each phase drives the real script through streamlit.testing.v1.AppTest into one
+state (join screen, normal play, curse received, cursed, confirming a deposit,
+trivia question open, full hand), then times many reruns of it. The database is
+an in-memory mongomock unless --mongo-url points at a real server, and the
+location stream's report and the secrets are stubbed.
+
+Medians are compared with benchmarks/rerun_baseline.json and the run fails when
+a phase is more than --tolerance slower. Baselines are only meaningful on the
+machine they were recorded on, so record one before starting performance work:
+
+    python benchmarks/reruns.py --update-baseline
+    python benchmarks/reruns.py
+
+Run from the repository root. mongomock (in requirements-dev.txt) is only needed for the default in-memory database.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from unittest import mock
+
+import pymongo
+from streamlit.logger import get_logger
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest, local_script_runner
+
+sys.path.insert(0, os.getcwd())
+import database  # noqa: E402
+from location_stream import LOCATION_KEY  # noqa: E402
+import game_actions  # noqa: E402
+import games  # noqa: E402
+from cards import new_deck  # noqa: E402
+from load_test import drop_games  # noqa: E402
+
+APP_PATH = "ottawa_game.py"
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rerun_baseline.json")
+DEFAULT_TOLERANCE = 0.25  # fail when a phase's median is more than 25% over its baseline
+IN_MEMORY_URL = "mongomock://benchmark"
+# What the location component reports for Parliament Hill, inside the play area
+LOCATION = {"seq": 1, "lat": 45.4245, "lon": -75.6990, "accuracy": 10, "at": 0}
+TEAM = "orange"
+
+
+def use_mongomock():
+    """Points the app's shared pool at an in-memory mongomock client and returns that client."""
+    try:
+        import mongomock
+    except ImportError:
+        raise SystemExit("The in-memory database needs mongomock (pip install -r requirements-dev.txt), or pass --mongo-url")
+
+    def watch(*args, **kwargs):
+        # Like a standalone mongod: no change streams, so the live-sync watcher polls
+        raise pymongo.errors.OperationFailure("The $changeStream stage is only supported on replica sets", 40573)
+
+    mongomock.collection.Collection.watch = watch
+    client = mongomock.MongoClient()
+    pool = mock.Mock(client=client, healthy=True, error=None)
+    database._pools[IN_MEMORY_URL] = pool
+    os.environ["MONGO_URL"] = IN_MEMORY_URL
+    return client
+
+
+def share_script_cache():
+    """Makes every AppTest run reuse one compiled copy of the script, as a server does.
+
+    AppTest compiles the script, magic rewrite included, afresh on every run. That
+    costs tens of milliseconds and grows faster than the script does, so without
+    this the gate mostly measures the length of ottawa_game.py.
+    """
+    cache = ScriptCache()
+    local_script_runner.ScriptCache = lambda: cache
+
+
+def new_app():
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.secrets["mongo_url"] = os.environ["MONGO_URL"]
+    at.secrets["map_tiler"] = "benchmark"
+    return at
+
+
+def join(at, game_id):
+    """Goes through the join screen the way a player does, ending on the map with a location."""
+    at.run()
+    at.text_input(key="game_id_input").input(game_id)
+    at.radio(key="team_radio").set_value(TEAM.title())
+    at.button[0].click()
+    at.run()
+    at.session_state[LOCATION_KEY] = LOCATION
+    at.run()
+    if at.session_state.lat is None:
+        raise RuntimeError("The stubbed location never reached the session")
+
+
+def setup_join(at, collection):
+    pass
+
+
+def setup_play(at, collection):
+    collection.update_one({"_id": TEAM}, {"$set": {"balance": 300}})
+
+
+def setup_curse_received(at, collection):
+    card = next(card for card in new_deck("benchmark") if card["type"] == "curse" and not card.get("auto_clear"))
+    collection.update_one({"_id": TEAM}, {"$push": {"active_curses": game_actions.build_curse(card)}})
+
+
+def setup_cursed(at, collection):
+    card = next(card for card in new_deck("benchmark") if card["type"] == "curse" and not card.get("auto_clear"))
+    curse = dict(game_actions.build_curse(card), acknowledged=True)
+    collection.update_one({"_id": TEAM}, {"$push": {"active_curses": curse}})
+
+
+def setup_confirming_deposit(at, collection):
+    collection.update_one({"_id": TEAM}, {"$set": {"balance": 300}})
+    at.session_state.confirming_deposit = True
+    at.session_state.deposit_amount_to_confirm = 50
+    at.session_state.deposit_token = uuid.uuid4().hex
+
+
+def setup_trivia_active(at, collection):
+    card = next(card for card in new_deck("benchmark") if card["type"] == "risky_trivia")
+    collection.update_one({"_id": TEAM}, {"$set": {"balance": 250, "hand": [card], "trivia_wager": {"card": card["title"], "amount": 50}}})
+    at.session_state.trivia_question_active = card
+    at.session_state.trivia_wager = 50
+
+
+def setup_full_hand(at, collection):
+    hand = [card for card in new_deck("benchmark") if card["type"] != "advantage"]
+    collection.update_one({"_id": TEAM}, {"$set": {"balance": 300, "hand": hand}})
+
+
+# Each phase's setup, and a button that only shows up once the script really is in that state
+PHASES = {
+    "join": (setup_join, "Go!"),
+    "play": (setup_play, "Draw a card"),
+    "curse_received": (setup_curse_received, "Acknowledge Curse"),
+    "cursed": (setup_cursed, "Clear Curse of"),
+    "confirming_deposit": (setup_confirming_deposit, "Confirm Deposit"),
+    "trivia_active": (setup_trivia_active, "Submit Answer"),
+    "full_hand": (setup_full_hand, "Use Curse of the Cairn"),
+}
+
+
+def time_reruns(at, iterations, warmup):
+    """Reruns the script warmup + iterations times and returns the timed iterations in seconds."""
+    timings = []
+    for i in range(warmup + iterations):
+        started = time.perf_counter()
+        at.run()
+        elapsed = time.perf_counter() - started
+        if at.exception:
+            raise RuntimeError(f"The script raised: {at.exception[0].message}")
+        if i >= warmup:
+            timings.append(elapsed)
+    return timings
+
+
+def run_phase(client, phase, iterations, warmup):
+    game_id = f"rerun-bench-{uuid.uuid4().hex[:8]}"
+    db = client[games.DATABASE_NAME]
+    at = new_app()
+    try:
+        if phase != "join":
+            join(at, game_id)
+        setup, expected_button = PHASES[phase]
+        setup(at, db[game_id])
+        timings = time_reruns(at, iterations, warmup)
+        if not any(expected_button in button.label for button in at.button):
+            raise RuntimeError(f"Phase {phase} never reached its screen (no {expected_button!r} button)")
+    finally:
+        if games.game_exists(db, game_id):
+            drop_games(db, [game_id])
+    timings.sort()
+    return {
+        "iterations": len(timings),
+        "median_ms": round(statistics.median(timings) * 1e3, 2),
+        "p95_ms": round(timings[min(len(timings) - 1, int(0.95 * len(timings)))] * 1e3, 2),
+        "min_ms": round(timings[0] * 1e3, 2),
+        "mean_ms": round(statistics.fmean(timings) * 1e3, 2),
+    }
+
+
+def find_regressions(results, baseline, tolerance):
+    """Returns {phase: message} for every phase whose median is over its baseline by more than tolerance."""
+    regressions = {}
+    for phase, result in results.items():
+        if phase not in baseline:
+            continue
+        limit = baseline[phase]["median_ms"] * (1 + tolerance)
+        if result["median_ms"] > limit:
+            regressions[phase] = (
+                f"{phase}: median {result['median_ms']:.1f} ms, baseline {baseline[phase]['median_ms']:.1f} ms (limit {limit:.1f} ms)"
+            )
+    return regressions
+
+
+def measure(client, phases, iterations, warmup):
+    results = {}
+    for phase in phases:
+        result = results[phase] = run_phase(client, phase, iterations, warmup)
+        print(f"{phase:<20} median {result['median_ms']:7.1f} ms   p95 {result['p95_ms']:7.1f} ms   min {result['min_ms']:7.1f} ms")
+    return results
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time reruns of ottawa_game.py in each UI state.")
+    parser.add_argument("--phases", nargs="+", choices=list(PHASES), default=list(PHASES))
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--mongo-url", help="use this MongoDB instead of the in-memory mongomock")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--output", help="also write the results as JSON here")
+    args = parser.parse_args()
+
+    # Setting AppTest's session state happens outside a script run, which logs a warning each time
+    get_logger("streamlit.runtime.scriptrunner_utils.script_run_context").disabled = True
+    share_script_cache()
+    if args.mongo_url:
+        os.environ["MONGO_URL"] = args.mongo_url
+        client, error = database.get_mongo_client()
+        if client is None:
+            raise SystemExit(f"Database connection failed: {error}")
+    else:
+        client = use_mongomock()
+
+    results = measure(client, args.phases, args.iterations, args.warmup)
+    baseline = load_baseline(args.baseline)
+    regressions = {}
+    if baseline and not args.update_baseline:
+        regressions = find_regressions(results, baseline, args.tolerance)
+        if regressions:
+            # A busy machine can slow a whole phase down, so a phase has to be slow twice in a row to fail
+            print(f"Measuring {', '.join(regressions)} again")
+            retried = measure(client, list(regressions), args.iterations, args.warmup)
+            results.update({phase: min(results[phase], retried[phase], key=lambda r: r["median_ms"]) for phase in retried})
+            regressions = find_regressions(results, baseline, args.tolerance)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+    elif not baseline:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to record one")
+    elif regressions:
+        print("Regressions:\n  " + "\n  ".join(regressions.values()))
+        raise SystemExit(1)
+    else:
+        print(f"No phase regressed more than {args.tolerance:.0%} past the baseline")
+
+
+if __name__ == "__main__":
+    main()
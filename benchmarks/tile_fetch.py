@@ -0,0 +1,112 @@
+"""Many phones loading the same downtown tiles through tile_proxy, against the stand-in tile server.
+
+Starts benchmarks/tile_server.py (with --latency of upstream delay) and a tile
+proxy on a throwaway MBTiles file in this process. It then has --clients
+phones each load every tile of the play area at once, twice: cold, then warm.
+It reports how many upstream fetches that took, the proxy's hit rate and the
+latencies, and finally checks that a prewarm of the zones leaves nothing for
+the phones to fetch.
+
+Run from the repository root: python benchmarks/tile_fetch.py
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.getcwd())
+from load_test import percentile  # noqa: E402
+from tile_server import TileServer  # noqa: E402
+from offline import precache_tiles  # noqa: E402
+from tile_proxy import get_tile_proxy, make_server  # noqa: E402
+from zones import get_zone_store  # noqa: E402
+
+
+def serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def load_tiles(proxy_url, tiles, clients):
+    """Every client fetches every tile, all at once; returns the sorted latencies in ms and the failures.
+
+    The clients' requests for a tile are queued next to each other, so they are in
+    flight together and exercise the proxy's coalescing.
+    """
+    def fetch(tile):
+        z, x, y = tile
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(f"{proxy_url}/{z}/{x}/{y}.png", timeout=30) as response:
+                response.read()
+        except OSError:
+            return None
+        return (time.perf_counter() - started) * 1e3
+
+    with ThreadPoolExecutor(max_workers=clients * 4) as pool:
+        results = list(pool.map(fetch, [tile for tile in tiles for _ in range(clients)]))
+    latencies = sorted(ms for ms in results if ms is not None)
+    return latencies, len(results) - len(latencies)
+
+
+def summary(latencies, failures):
+    return {
+        "requests": len(latencies) + failures,
+        "failures": failures,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "max_ms": round(latencies[-1], 2),
+    }
+
+
+def upstream_tiles(upstream):
+    with upstream.stats_lock:
+        return upstream.stats["tiles"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tile proxy against a stand-in upstream.")
+    parser.add_argument("--clients", type=int, default=10, help="phones loading the play area at once")
+    parser.add_argument("--max-zoom", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds the stand-in upstream takes per tile")
+    parser.add_argument("--output", help="also write the report as JSON here")
+    args = parser.parse_args()
+
+    bounds = get_zone_store().total_bounds
+    tiles = precache_tiles(bounds, max_zoom=args.max_zoom)
+    upstream = TileServer(("127.0.0.1", 0), latency=args.latency)
+    upstream_url = serve(upstream) + "/{z}/{x}/{y}.png"
+    report = {"tiles": len(tiles), "clients": args.clients}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        proxy = get_tile_proxy("", os.path.join(tmp, "cold.mbtiles"), upstream_url)
+        proxy_url = serve(make_server(proxy, port=0))
+        for run in ("cold", "warm"):
+            before = upstream_tiles(upstream)
+            report[run] = summary(*load_tiles(proxy_url, tiles, args.clients))
+            report[run]["upstream_fetches"] = upstream_tiles(upstream) - before
+        report["proxy_stats"] = proxy.stats()
+
+        prewarmed = get_tile_proxy("", os.path.join(tmp, "prewarmed.mbtiles"), upstream_url)
+        report["prewarm"] = prewarmed.prewarm(bounds, max_zoom=args.max_zoom)
+        before = upstream_tiles(upstream)
+        load_tiles(serve(make_server(prewarmed, port=0)), tiles, args.clients)
+        report["prewarm"]["upstream_fetches_after"] = upstream_tiles(upstream) - before
+        report["prewarm"]["hit_rate_after"] = prewarmed.stats()["hit_rate"]
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    if args.clients > 1 and report["proxy_stats"]["coalesced"] == 0:
+        raise SystemExit("No request was coalesced: the clients never asked for a tile that was being fetched")
+
+
+if __name__ == "__main__":
+    main()
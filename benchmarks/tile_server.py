@@ -0,0 +1,114 @@
+"""A stand-in for the MapTiler tile server, for trying the offline map and tile caching without a key or network.
+
+Serves a generated 256x256 PNG for every /{z}/{x}/{y}.png (any query string is
+ignored), with CORS headers like MapTiler's, and counts what it served:
+
+    python benchmarks/tile_server.py --port 8600 --latency 0.2
+    TILE_URL="http://127.0.0.1:8600/{z}/{x}/{y}.png?key=" streamlit run ottawa_game.py
+    curl -s localhost:8600/stats
+
+--fail-rate makes that share of tile requests answer 503, to play a patchy connection.
+"""
+import argparse
+import json
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+TILE_SIZE = 256
+TILE_PATH = re.compile(r"^/(\d+)/(\d+)/(\d+)\.png$")
+
+
+@lru_cache(maxsize=1024)
+def tile_png(z, x, y):
+    """A flat-coloured PNG whose colour depends on the tile, so mixed-up tiles are easy to spot."""
+    colour = bytes(((x * 67 + z * 13) % 256, (y * 101 + z * 29) % 256, (z * 37) % 256))
+    row = b"\x00" + colour * TILE_SIZE
+    raw = zlib.compress(row * TILE_SIZE)
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", TILE_SIZE, TILE_SIZE, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", raw) + chunk(b"IEND", b"")
+
+
+class TileServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, latency=0.0, fail_rate=0.0):
+        super().__init__(address, TileHandler)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.stats_lock = threading.Lock()
+        self.stats = {"tiles": 0, "failed": 0, "not_found": 0}
+
+    def count(self, name):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/stats":
+            with self.server.stats_lock:
+                self._send(200, "application/json", json.dumps(self.server.stats).encode())
+            return
+        match = TILE_PATH.match(path)
+        if match is None:
+            self.server.count("not_found")
+            self._send(404, "text/plain", b"Not found")
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if random.random() < self.server.fail_rate:
+            self.server.count("failed")
+            self._send(503, "text/plain", b"Unavailable")
+            return
+        z, x, y = (int(part) for part in match.groups())
+        if not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+            self.server.count("not_found")
+            self._send(404, "text/plain", b"No such tile")
+            return
+        self.server.count("tiles")
+        self._send(200, "image/png", tile_png(z, x, y))
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Cache-Control", "max-age=86400")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve generated map tiles in place of MapTiler.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before answering each tile")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of tile requests answered with 503")
+    args = parser.parse_args()
+
+    server = TileServer((args.host, args.port), latency=args.latency, fail_rate=args.fail_rate)
+    print(f"Serving tiles on http://{args.host}:{args.port}/{{z}}/{{x}}/{{y}}.png")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Micro-benchmarks for zone lookups.
+
+Compares ZoneStore.locate against the per-call sjoin_nearest it replaced, and
+measures ZoneStore.locate_many throughput on a million fixes.
+Run from the repository root: python benchmarks/zone_lookup.py
+"""
+import os
+import sys
+import time
+import timeit
+import warnings
+
+import geopandas as gpd
+import numpy as np
+from shapely.geometry import Point
+
+sys.path.insert(0, os.getcwd())
+from zones import get_zone_store  # noqa: E402
+
+
+def sjoin_nearest_zone(user_lat, user_lon, gdf):
+    user_gdf = gpd.GeoDataFrame([1], geometry=[Point(user_lon, user_lat)], crs="EPSG:4326")
+    nearest = gpd.sjoin_nearest(user_gdf, gdf, how="left")
+    return nearest.index_right.iloc[0] + 1
+
+
+def main():
+    # sjoin_nearest warns about distances in a geographic CRS on every call
+    warnings.filterwarnings("ignore", category=UserWarning)
+    store = get_zone_store()
+    gdf = gpd.read_file(store.path, driver="KML")
+
+    rng = np.random.default_rng(0)
+    min_lon, min_lat, max_lon, max_lat = store.total_bounds
+    points = list(zip(rng.uniform(min_lat, max_lat, 1000), rng.uniform(min_lon, max_lon, 1000)))
+
+    n = len(points)
+    locate = timeit.timeit(lambda: [store.locate(lat, lon) for lat, lon in points], number=5) / (5 * n)
+    old_points = points[:50]
+    old = timeit.timeit(lambda: [sjoin_nearest_zone(lat, lon, gdf) for lat, lon in old_points], number=1) / len(old_points)
+
+    print(f"sjoin_nearest:     {old * 1e6:10.1f} us/lookup")
+    print(f"ZoneStore.locate:  {locate * 1e6:10.1f} us/lookup")
+    print(f"speedup:           {old / locate:10.0f}x")
+
+    # Uniform over the bounding box puts about half the fixes outside every zone;
+    # the in-zone set is closer to a real trace recorded during a game
+    n = 1_000_000
+    lats, lons = rng.uniform(min_lat, max_lat, n), rng.uniform(min_lon, max_lon, n)
+    ids, _ = store.locate_many(lats, lons, max_distance=0)
+    in_zone = (lats[ids > 0], lons[ids > 0])
+    in_zone = (np.resize(in_zone[0], n), np.resize(in_zone[1], n))
+    for label, (batch_lats, batch_lons) in (("bounding box", (lats, lons)), ("in zones", in_zone)):
+        start = time.perf_counter()
+        store.locate_many(batch_lats, batch_lons)
+        elapsed = time.perf_counter() - start
+        print(f"locate_many ({label}): {n / elapsed:12,.0f} points/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import random
+
+from render_cache import render_cache
+
+DRAW_COST = 100
+
+# Define all cards
+CARDS = {
+    "lemon_phylactery": {
+        "title": "Curse of the Lemon Phylactery",
+        "description": "Before your opponent can deposit points or complete another challenge, they must first affix a lawfully obtained lemon or lime fruit to one of their campers for the rest of the game. If the citrus detaches from the camper before the end of the program, the team must memorize and correctly recite all members of the Canadian cabinet before they can continue with anything else. The office will reimburse you up to $10 for a lemon and/or materials to attach it to a camper. Make sure to keep any receipts.",
+        "type": "curse",
+        "link": "https://www.pm.gc.ca/en/cabinet"
+    },
+    "gamblers_feet": {
+        "title": "Curse of the Gambler's Feet",
+        "description": "The cursed team must set a timer for 10 minutes. During those 10 minutes, they must roll a die to move in any direction. They may only take as many steps as they roll until they have to roll again.",
+        "type": "curse",
+        "link": "https://g.co/kgs/WJ82Wo9",
+        "auto_clear": True
+    },
+    "struck_gold": {
+        "title": "Advantage: You struck gold!",
+        "description": "Your next challenge is worth 1.5 times its value! You can't draw another card until you complete a challenge, though.",
+        "type": "advantage"
+    },
+    "luxury_car": {
+        "title": "Curse of the Luxury Car",
+        "description": "Take a photo of a car. The cursed team must take a photo of a more expensive car before your opponent can deposit points or complete another challenge. You must text a photo of your car and input its minimum retail price.",
+        "type": "curse_with_input",
+        "link": "https://carcostcanada.com/Home/Detailed"
+    },
+    "risky_geography": {
+        "title": "Risky Trivia: Geography",
+        "description": "You will be asked a trivia question. You can wager your points below. If you get it right, you will get three times as much back. If you get it wrong, you will lose the points you wagered. You cannot look up the answer.",
+        "type": "risky_trivia",
+        "question": "What is the population of metropolitan Ottawa? (Answer within 200,000 and it will be considered correct).",
+        "answer": 1488307,
+        "tolerance": 200000
+    },
+    "risky_politics": {
+        "title": "Risky Trivia: Politics",
+        "description": "You will be asked a multiple-choice trivia question. You can wager your points below. If you get it right, you will get three times as much back. If you get it wrong, you will lose the points you wagered. You cannot look up the answer.",
+        "type": "risky_trivia_mc",
+        "question": "Which of these people was not a prime minister of Canada?",
+        "options": ["Robert Borden", "Kim Campbell", "Rick Mercer", "Louis St. Laurent"],
+        "answer": "Rick Mercer"
+    },
+    "risky_history": {
+        "title": "Risky Trivia: History",
+        "description": "You will be asked a multiple-choice trivia question. You can wager your points below. If you get it right, you will get three times as much back. If you get it wrong, you will lose the points you wagered. You cannot look up the answer.",
+        "type": "risky_trivia_mc",
+        "question": "Which of these cities was not a capital of the United Province of Canada before Ottawa was made the permanent capital in 1857?",
+        "options": ["London, Ontario", "Toronto, Ontario", "Montreal, Quebec", "Quebec City, Quebec", "Kingston, Ontario"],
+        "answer": "London, Ontario"
+    },
+    "cairn": {
+        "title": "Curse of the Cairn",
+        "description": "You have one attempt to stack as many rocks on top of each other as you can in a freestanding tower. Each rock may only touch one other rock. Once you have added a rock to the tower, it may not be removed. Before adding another rock, the tower must stand for at least five seconds. If at any point, any rock other than the base rock touches the ground, your tower has fallen. The cursed team must then construct a rock tower of the same number of rocks under the same parameters.",
+        "type": "curse_with_input"
+    },
+    "bird_guide": {
+        "title": "Curse of the Bird Guide",
+        "description": "You have one chance to film a bird for as long as possible, up to 7 minutes straight. If, at any point, the bird leaves the frame, your timer is stopped. The cursed team must film a bird for a longer time than you before they can deposit points or complete another challenge.",
+        "type": "curse_with_input"
+    },
+    "right_turn": {
+        "title": "Curse of the Right Turn",
+        "description": "The cursed team will have to set a 12 minute timer. Until the end of that timer, they can only go straight or right at any street intersection.",
+        "type": "curse",
+        "auto_clear": True
+    }
+}
+
+
+def new_deck(seed, exclude=()):
+    """Returns every card not in exclude, shuffled reproducibly from seed, ready to be stored on a team."""
+    card_ids = [card_id for card_id in sorted(CARDS) if card_id not in exclude]
+    random.Random(seed).shuffle(card_ids)
+    return [dict(CARDS[card_id], id=card_id) for card_id in card_ids]
+
+
+def card_markdown(card):
+    """The title, description and link of a card in the hand, as one markdown block."""
+    return _card_markdown(card["title"], card["description"], card.get("link"))
+
+
+@render_cache("card", maxsize=64)
+def _card_markdown(title, description, link):
+    markdown = f"**{title}**\n\n{description}"
+    if link:
+        markdown += f"\n\n[Helpful Link]({link})"
+    return markdown
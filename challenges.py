@@ -0,0 +1,277 @@
+# Every challenge location on the map
+CHALLENGES = (
+{
+   "id": "fairmount-chateau-laurier",
+   "location": "Fairmount Château Laurier",
+   "lat": 45.42566,
+   "lon": -75.69529,
+   "title": "Fancy Washroom",
+   "challenge": "Have a team member use a toilet in the Fairmount Château Laurier.",
+   "points": 300,
+   "zone": 8,
+   "link": "https://maps.google.com/?cid=8854846295512453637",
+},
+{
+   "id": "national-gallery-of-canada",
+   "location": "National Gallery of Canada",
+   "lat": 45.42935,
+   "lon": -75.69727,
+   "title": "Recreate Maman",
+   "challenge": "Take a photo of one camper making a bridge or 4-legged pose and another camper overtop of them to be the other 4 spider legs.",
+   "points": 100,
+   "zone": 8,
+   "link": "https://maps.google.com/?cid=7418760184671049655",
+},
+{
+   "id": "kiweki-point",
+   "location": "Kìwekì Point",
+   "lat": 45.4296,
+   "lon": -75.70098,
+   "title": "Explore for an Explorer",
+   "challenge": "Find and recreate the Samuel de Champlain statue at Kìwekì Point without looking up the exact location of the statue (it is in the park).",
+   "points": 200,
+   "zone": 8,
+   "link": "https://maps.google.com/?cid=10074131504615629002",
+},
+{
+   "id": "bytown-museum",
+   "location": "Bytown Museum",
+   "lat": 45.42586,
+   "lon": -75.69767,
+   "title": "",
+   "challenge": """Watch <a target="_blank" href="https://www.youtube.com/watch?v=SVsQuv8P9-g">this short video</a> about the Bytown Museum and the history of Ottawa outside the Bytown Museum.""",
+   "points": 100,
+   "zone": 1,
+   "link": "https://maps.google.com/?cid=5318761341977640144",
+},
+{
+   "id": "senate-of-canada",
+   "location": "Senate of Canada",
+   "lat": 45.42477,
+   "lon": -75.69399,
+   "title": "Identify the Famous Five",
+   "challenge": """Find the statues of the Famous Five suffragettes outside the Supreme Court at a monument called "Women Are Persons!" Read out <a target="_blank" href="https://www.canada.ca/en/canadian-heritage/services/art-monuments/monuments/women-are-persons.html">this very short article</a>. Spend at least 30 seconds discussing the women's suffrage movement in Canada. Then, all of the campers must learn and recite all of their names and read any plaques that may accompany the statues to complete the challenge.""",
+   "points": 100,
+   "zone": 6,
+   "link": "https://maps.google.com/?cid=761047823053711970",
+},
+{
+   "id": "national-arts-centre",
+   "location": "National Arts Centre",
+   "lat": 45.42327,
+   "lon": -75.69338,
+   "title": "Enjoy some Canadian art",
+   "challenge": "Listen to (and appreciate) all of Welcome to the Rock from the viral Canadian musical Come From Away.",
+   "points": 100,
+   "zone": 3,
+   "link": "https://maps.google.com/?cid=2011512308839086810",
+},
+{
+   "id": "ottawa-jail-hostel",
+   "location": "Ottawa Jail Hostel",
+   "lat": 45.424749,
+   "lon": -75.688747,
+   "title": "The Jail Hostel",
+   "challenge": """Enter the Arts Court at <a target="_blank" href="https://maps.app.goo.gl/Y3kkZHfwK7uUQjRv7">2 Daly Ave</a> (the former courthouse and find the 2 publicly accessible jail cells in the Arts Court. Once there, read <a target="_blank" href="https://www.atlasobscura.com/places/ottawa-jail-hostel">this article</a> about the connected Ottawa Jail Hostel. If you spend at least 8 minutes looking for the cells unsuccessfully, you can read the article outside the entrance to the hostel at <a target="_blank" href="https://maps.app.goo.gl/Y3kkZHfwK7uUQjRv7">75 Nicholas St</a>.""",
+   "points": 300,
+   "zone": 6,
+   "link": "https://maps.app.goo.gl/Y3kkZHfwK7uUQjRv7",
+},
+{
+   "id": "centennial-flame",
+   "location": "Centennial Flame",
+   "lat": 45.42373,
+   "lon": -75.6987,
+   "title": "Stand on Guard for Thee",
+   "challenge": "Find a Mountie in their formal uniform guarding the parliament. Take a photo of all the campers in your group mimicking their pose alongside them.",
+   "points": 200,
+   "zone": 2,
+   "link": "https://maps.google.com/?cid=9981869545010240994",
+},
+{
+   "id": "rideau-centre",
+   "location": "Rideau Centre",
+   "lat": 45.42589,
+   "lon": -75.69208,
+   "title": "Find a Prime Minister",
+   "challenge": "Before 9pm: Take a photo of a book (supposedly) written by a Prime Minister the !ndigo store at the Rideau Centre without asking an employee. After the Rideau Centre closes at 9pm, you can instead photograph the name of a Prime Minister in the Rideau LRT station connected to the mall without the help of any employees there. You cannot write the name yourself or find it on a mobile device.",
+   "points": 300,
+   "zone": 6,
+   "link": "https://maps.app.goo.gl/8qrvtrwQyEGQE3bz9",
+},
+{
+   "id": "house-of-commons",
+   "location": "House of Commons",
+   "lat": 45.42332,
+   "lon": -75.7005,
+   "title": "Drag the Speaker of the House",
+   "challenge": """There is a tradition that a newly elected Speaker of the House is dragged to their chair, because, historically, British speakers risked execution if the news they reported to the king was displeasing. Watch <a target="_blank" href="https://www.youtube.com/shorts/HIQ1VyJA1vM">this video of House Speaker Francis Scarpaleggia being dragged to his seat</a>. Then pick up a camper (with the campers) and carry them for at least 20 metres (66').""",
+   "points": 200,
+   "zone": 2,
+   "link": "https://maps.google.com/?cid=13333871194299290015",
+},
+{
+   "id": "city-hall",
+   "location": "City Hall",
+   "lat": 45.4208,
+   "lon": -75.68999,
+   "title": "O Canada",
+   "challenge": "Sing the national anthem (bilingually)",
+   "points": 100,
+   "zone": 3,
+   "link": "https://maps.google.com/?cid=9794861075158029403",
+},
+{
+   "id": "supreme-court-of-canada",
+   "location": "Supreme Court of Canada",
+   "lat": 45.42185,
+   "lon": -75.70537,
+   "title": "The Scales of Justice",
+   "challenge": "Use materials found in nature to make a scale. It must make a T shape with an item hanging from each side of the T that do not touch the ground.",
+   "points": 300,
+   "zone": 1,
+   "link": "https://maps.app.goo.gl/RSJRh2Lgke2YwgV9A",
+},
+{
+   "id": "tabaret-hall",
+   "location": "Tabaret Hall",
+   "lat": 45.42453,
+   "lon": -75.68632,
+   "title": "Social Anxiety Test",
+   "challenge": "Get someone to salute alongside all of the campers in your group in a photo.",
+   "points": 200,
+   "zone": 6,
+   "link": "https://www.google.com/maps?cid=15941439919447695894",
+},
+{
+   "id": "rideau-canal-locks",
+   "location": "Rideau Canal Locks",
+   "lat": 45.4248,
+   "lon": -75.69522,
+   "title": "Melted Ice Skating",
+   "challenge": "The Rideau Canal Skateway is the longest skating venue in the world … in winter. Have two campers try to skate on land. They must move at least 10 metres (33') each without either of their feet ever losing contact with the ground completely.",
+   "points": 200,
+   "zone": 3,
+   "link": "https://www.google.com/maps/place/Rideau+Canal,+Locks+1+-+8+-+Ottawa/@45.4248006,-75.695228,17z/data=!3m1!4b1!4m6!3m5!1s0x4cce04fe324ecc63:0xf564613f62f3104c!8m2!3d45.4248006!4d-75.695228!16s%2Fg%2F11x9mcwtk?entry=ttu&g_ep=EgoyMDI1MDcwNi4wIKXMDSoASAFQAw%3D%3D",
+},
+{
+   "id": "confederation-park",
+   "location": "Confederation Park",
+   "lat": 45.42239,
+   "lon": -75.69245,
+   "title": "Leaving the Comfort Zone",
+   "challenge": "Convince a stranger to dab with a camper in a photo in Confederation Park.",
+   "points": 200,
+   "zone": 4,
+   "link": "https://maps.google.com/?cid=5677298280561665746",
+},
+{
+   "id": "byward-market",
+   "location": "ByWard Market",
+   "lat": 45.42775,
+   "lon": -75.69243,
+   "title": "International City",
+   "challenge": "Find food items on a menu or at a food stall that is most associated with a specific country/region on 3 different continents besides North America.",
+   "points": 200,
+   "zone": 7,
+   "link": "https://maps.google.com/?cid=2099143516218795562",
+},
+{
+   "id": "embassy-of-mexico",
+   "location": "Embassy of Mexico",
+   "lat": 45.42127,
+   "lon": -75.69808,
+   "title": "Diplomatic Stroll",
+   "challenge": "Without using a phone to navigate, start at the Mexican embassy and photograph another embassy.",
+   "points": 300,
+   "zone": 9,
+   "link": "https://maps.google.com/?cid=14539730619693688087",
+},
+{
+   "id": "uottawa-station",
+   "location": "uOttawa Station",
+   "lat": 45.42076,
+   "lon": -75.68275,
+   "title": "Find a Train",
+   "challenge": "Photograph an LRT vehicle from uOttawa station.",
+   "points": 200,
+   "zone": 5,
+   "link": "https://maps.google.com/?cid=17247419341606602483",
+},
+{
+   "id": "university-square",
+   "location": "University Square",
+   "lat": 45.42181,
+   "lon": -75.68296,
+   "title": "Ottawa's Got Talent",
+   "challenge": "Camper must awkwardly dance for a full minute with no music in University Square on video.",
+   "points": 100,
+   "zone": 5,
+   "link": "https://maps.google.com/?cid=3627643191025529899",
+},
+{
+   "id": "morisset-library",
+   "location": "Morisset Library",
+   "lat": 45.42326,
+   "lon": -75.68402,
+   "title": "Find some University Pride",
+   "challenge": "Take a photo of a camper with someone wearing University of Ottawa GGs merch. It must say GGs (regular uOttawa merch does not count).",
+   "points": 300,
+   "zone": 5,
+   "link": "https://maps.google.com/?cid=16222945467375777481",
+},
+{
+   "id": "parliament-hill",
+   "location": "Parliament Hill",
+   "lat": 45.42586,
+   "lon": -75.70023,
+   "title": "Canada's First Rulers",
+   "challenge": "Find the statues of Canada's first prime minister and first monarch post-confederation (John A. Macdonald and Queen Victoria). Take a photo of a camper recreating their poses next to each statue.",
+   "points": 200,
+   "zone": 1,
+   "link": "https://maps.google.com/?cid=16265817237874429587",
+},
+{
+   "id": "saint-patrick-basilica",
+   "location": "Saint Patrick Basilica",
+   "lat": 45.41649,
+   "lon": -75.7009,
+   "title": "Find Christ",
+   "challenge": "Photograph 5 different crosses on Saint Patrick Basilica.",
+   "points": 200,
+   "zone": 9,
+   "link": "https://maps.google.com/?cid=4958757389272605047",
+},
+{
+   "id": "ottawa-sign",
+   "location": "Ottawa Sign",
+   "lat": 45.4275,
+   "lon": -75.69449,
+   "title": "Recreate the Ottawa Sign",
+   "challenge": "Have your campers spell out Ottawa with their bodies in a photo in front of the Ottawa sign.",
+   "points": 200,
+   "zone": 7,
+   "link": "https://maps.google.com/?cid=6146839926272358918",
+},
+)
+
+CHALLENGES_BY_ID = {challenge["id"]: challenge for challenge in CHALLENGES}
+# Marker positions come back from Leaflet as floats, so the index is keyed on rounded coordinates
+COORD_PRECISION = 6
+CHALLENGES_BY_COORD = {(round(challenge["lat"], COORD_PRECISION), round(challenge["lon"], COORD_PRECISION)): challenge for challenge in CHALLENGES}
+# Games started before challenges had ids recorded completions by title
+_IDS_BY_TITLE = {challenge["title"]: challenge["id"] for challenge in CHALLENGES}
+
+
+def challenge_at(lat, lon):
+    """Returns the challenge whose marker sits at (lat, lon), or None."""
+    return CHALLENGES_BY_COORD.get((round(lat, COORD_PRECISION), round(lon, COORD_PRECISION)))
+
+
+def completed_ids(completed_challenges):
+    """Normalizes a team's completed_challenges to challenge ids, translating legacy titles."""
+    return frozenset(
+        entry if entry in CHALLENGES_BY_ID else _IDS_BY_TITLE[entry]
+        for entry in completed_challenges
+        if entry in CHALLENGES_BY_ID or entry in _IDS_BY_TITLE
+    )
@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+
+import pymongo
+import streamlit as st
+
+HEALTH_CHECK_INTERVAL = 5  # seconds between pings while the cluster is up
+MAX_RECONNECT_BACKOFF = 60  # cap for the exponential backoff while it is down
+FIRST_CHECK_TIMEOUT = 10  # how long the join screen waits for the first ping
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_mongo_url():
+    """Returns the MongoDB connection string from the environment or Streamlit secrets."""
+    return os.environ.get("MONGO_URL") or st.secrets["mongo_url"]
+
+
+def describe_mongo_error(e):
+    """Turns a pymongo exception into a message the players can act on."""
+    if isinstance(e, pymongo.errors.ServerSelectionTimeoutError):
+        return f"Server selection timeout - please check your internet connection and MongoDB Atlas settings: {str(e)}"
+    if isinstance(e, pymongo.errors.ConnectionFailure):
+        return f"Connection failure - check if your IP is whitelisted in MongoDB Atlas: {str(e)}"
+    if isinstance(e, pymongo.errors.ConfigurationError):
+        return f"Configuration error - check your connection string: {str(e)}"
+    return f"Unexpected error: {str(e)}"
+
+
+class MongoPool:
+    """A MongoClient shared by every session in the process, kept under watch by a background thread.
+
+    The monitor pings the cluster every HEALTH_CHECK_INTERVAL seconds and backs off
+    exponentially while it is unreachable, so reruns only read the last known state
+    instead of paying for a handshake and a ping themselves.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.client = None
+        self.error = None
+        self.healthy = False
+        self._client_lock = threading.Lock()
+        self._checked = threading.Event()
+        self._thread = threading.Thread(target=self._monitor, name="mongo-health-monitor", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        return pymongo.MongoClient(
+            self.url,
+            serverSelectionTimeoutMS=8000,  # 8 seconds
+            connectTimeoutMS=8000,
+            socketTimeoutMS=8000,
+            retryWrites=True,
+            w='majority',
+            compressors="zlib",
+            appname="ottawa-game",
+        )
+
+    def _check(self):
+        try:
+            # recheck() runs this on a session thread while the monitor may be in it too;
+            # only one of them may create the client
+            with self._client_lock:
+                if self.client is None:
+                    self.client = self._connect()
+                client = self.client
+            client.admin.command('ping')
+            self.healthy = True
+            self.error = None
+        except Exception as e:
+            self.healthy = False
+            self.error = describe_mongo_error(e)
+        finally:
+            self._checked.set()
+        return self.healthy
+
+    def _monitor(self):
+        backoff = 1
+        while True:
+            if self._check():
+                backoff = 1
+                time.sleep(HEALTH_CHECK_INTERVAL)
+            else:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, MAX_RECONNECT_BACKOFF)
+
+    def recheck(self):
+        """Pings right away instead of waiting out the backoff, e.g. when a player taps Retry."""
+        return self._check()
+
+    def wait_until_checked(self, timeout=FIRST_CHECK_TIMEOUT):
+        """Blocks until the monitor has finished its first ping (or the timeout expires)."""
+        return self._checked.wait(timeout)
+
+
+def get_mongo_pool(url=None):
+    """Returns the process-wide pool for url, starting its monitor on first use."""
+    url = url or get_mongo_url()
+    with _pools_lock:
+        pool = _pools.get(url)
+        if pool is None:
+            pool = _pools[url] = MongoPool(url)
+    return pool
+
+
+def get_mongo_client():
+    """Returns (client, None) while the monitor sees the cluster as up, otherwise (None, error).
+
+    Only the very first call in a process waits, for the monitor's first ping.
+    """
+    try:
+        pool = get_mongo_pool()
+    except Exception as e:
+        return None, describe_mongo_error(e)
+
+    pool.wait_until_checked()
+    if pool.healthy:
+        return pool.client, None
+    return None, pool.error or "Database is not reachable yet"
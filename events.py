@@ -0,0 +1,197 @@
+"""Append-only log of everything that happens in a game, with replay from snapshots.
+
+game_actions writes each action straight into the team documents (with its
+guards) and appends what it did here in the same transaction, so the log and the
+team documents commit or fail together. The team documents are therefore a
+materialized view of the log. apply_event is the projector that defines how
+each event changes a team, and replay() / rebuild_team_documents() use it to
+recompute (and repair) that view from the log.
+
+Every game has a snapshot at seq 0 holding its starting state. Another one is
+written every SNAPSHOT_INTERVAL events, so a replay only ever has to apply the
+events since the latest snapshot.
+
+The log is off unless EVENT_LOG=1: it turns every action into a transaction with
+two more writes (the counter on the game's registry entry and the event), and
+needs a replica set.
+"""
+import copy
+import datetime
+import os
+
+import pymongo
+from pymongo import ReturnDocument
+
+from snapshot import REGISTRY_COLLECTION, TEAMS
+
+EVENTS_COLLECTION = "events"
+SNAPSHOTS_COLLECTION = "snapshots"
+SNAPSHOT_INTERVAL = 100
+# Snapshots trail the newest event a little, so actions that took an earlier seq have landed in the log
+SNAPSHOT_LAG = 10
+EVENT_LOG_ENABLED = os.environ.get("EVENT_LOG", "0") == "1"
+
+_indexed = set()
+
+
+def _ensure_indexes(db):
+    # create_index is a no-op when the index exists, but still a round trip, so only do it once per process
+    if db.name not in _indexed:
+        db[EVENTS_COLLECTION].create_index([("game", 1), ("seq", 1)], unique=True)
+        db[EVENTS_COLLECTION].create_index([("game", 1), ("team", 1), ("seq", 1)])
+        db[SNAPSHOTS_COLLECTION].create_index([("game", 1), ("seq", -1)], unique=True)
+        _indexed.add(db.name)
+
+
+def start_log(db, game_id):
+    """Records a game's current team documents as its seq 0 snapshot, unless it already has one."""
+    if not EVENT_LOG_ENABLED:
+        return
+    _ensure_indexes(db)
+    teams = {doc.pop("_id"): doc for doc in db[game_id].find({"_id": {"$in": list(TEAMS)}})}
+    try:
+        db[SNAPSHOTS_COLLECTION].update_one(
+            {"game": game_id, "seq": 0},
+            {"$setOnInsert": {"teams": teams, "at": _now()}},
+            upsert=True,
+        )
+    except pymongo.errors.DuplicateKeyError:
+        # Another join wrote the starting snapshot first
+        pass
+
+
+def record(collection, team, event_type, session=None, **data):
+    """Appends one event for team to its game's log, snapshotting when the log crosses an interval.
+
+    Pass the session of the transaction making the state change, so both commit together.
+    """
+    if not EVENT_LOG_ENABLED:
+        return None
+    db, game_id = collection.database, collection.name
+    _ensure_indexes(db)
+    # The per-game event counter lives on the registry entry
+    counter = db[REGISTRY_COLLECTION].find_one_and_update(
+        {"_id": game_id},
+        {"$inc": {"event_seq": 1}},
+        projection={"event_seq": 1},
+        return_document=ReturnDocument.AFTER,
+        session=session,
+    )
+    if counter is None:
+        # Joined before the registry existed; the log starts once the game is registered on the next join
+        return None
+    event = {"game": game_id, "seq": counter["event_seq"], "team": team, "type": event_type, "data": data, "at": _now()}
+    db[EVENTS_COLLECTION].insert_one(event, session=session)
+    if event["seq"] % SNAPSHOT_INTERVAL == SNAPSHOT_LAG:
+        write_snapshot(db, game_id, event["seq"] - SNAPSHOT_LAG)
+    return event["seq"]
+
+
+def write_snapshot(db, game_id, seq):
+    """Stores the replayed state of both teams as of event seq."""
+    teams, replayed_to = replay(db, game_id, upto=seq)
+    try:
+        db[SNAPSHOTS_COLLECTION].update_one(
+            {"game": game_id, "seq": replayed_to},
+            {"$setOnInsert": {"teams": teams, "at": _now()}},
+            upsert=True,
+        )
+    except pymongo.errors.DuplicateKeyError:
+        pass
+
+
+def replay(db, game_id, upto=None):
+    """Rebuilds both teams from the latest snapshot plus the events after it.
+
+    Returns ({team: document without _id}, seq of the last event applied).
+    """
+    seq_filter = {"$lte": upto} if upto is not None else {"$gte": 0}
+    snapshot = db[SNAPSHOTS_COLLECTION].find_one({"game": game_id, "seq": seq_filter}, sort=[("seq", -1)])
+    if snapshot is None:
+        raise LookupError(f"Game {game_id} has no starting snapshot to replay from")
+
+    teams, seq = snapshot["teams"], snapshot["seq"]
+    event_filter = {"game": game_id, "seq": {"$gt": seq}}
+    if upto is not None:
+        event_filter["seq"]["$lte"] = upto
+    for event in db[EVENTS_COLLECTION].find(event_filter, sort=[("seq", 1)]):
+        apply_event(teams, event)
+        seq = event["seq"]
+    return teams, seq
+
+
+def rebuild_team_documents(db, game_id):
+    """Overwrites both team documents with their state replayed from the log, e.g. after a bad write."""
+    teams, seq = replay(db, game_id)
+    for team, doc in teams.items():
+        # The notification counter isn't part of the log, and the feed's seqs must keep counting up
+        current = db[game_id].find_one({"_id": team}, {"notification_seq": 1, "version": 1}) or {}
+        if "notification_seq" in current:
+            doc["notification_seq"] = current["notification_seq"]
+        doc["version"] = current.get("version", 0) + 1
+        db[game_id].replace_one({"_id": team}, doc, upsert=True)
+    return seq
+
+
+def apply_event(teams, event):
+    """The projector: applies one logged event to the team documents in teams, in place."""
+    data = event["data"]
+    team = teams.setdefault(event["team"], {})
+    other = teams.setdefault(_other_team(event["team"]), {})
+    event_type = event["type"]
+
+    if event_type == "deposit":
+        team["balance"] = team.get("balance", 0) - data["amount"]
+        zone_field = f"zone_{data['zone']}"
+        team[zone_field] = team.get(zone_field, 0) + data["amount"]
+        team["deposit_tokens"] = (team.get("deposit_tokens", []) + [data["token"]])[-data["recent_tokens"]:]
+    elif event_type == "challenge_completed":
+        team["balance"] = team.get("balance", 0) + data["points"]
+        team.setdefault("completed_challenges", [])
+        if data["challenge"] not in team["completed_challenges"]:
+            team["completed_challenges"].append(data["challenge"])
+        if data["gold_rush"]:
+            team["gold_rush_active"] = False
+            _pull(team, "hand", "title", "Advantage: You struck gold!")
+    elif event_type == "deck_built":
+        team["deck"] = copy.deepcopy(data["deck"])
+        if "salt" in data:
+            team["deck_salt"] = data["salt"]
+    elif event_type == "card_drawn":
+        card = copy.deepcopy(data["card"])
+        team["balance"] = team.get("balance", 0) - data["cost"]
+        team.setdefault("hand", []).append(card)
+        team.setdefault("drawn_cards", []).append(card["id"])
+        team["deck"] = [deck_card for deck_card in team.get("deck", []) if deck_card.get("id") != card["id"]]
+        team["gold_rush_active"] = card["type"] == "advantage"
+    elif event_type == "curse_sent":
+        other.setdefault("active_curses", []).append(copy.deepcopy(data["curse"]))
+        _pull(team, "hand", "title", data["card"])
+    elif event_type == "curse_acknowledged":
+        for curse in team.get("active_curses", []):
+            if curse["title"] == data["curse"]:
+                curse["acknowledged"] = True
+                break
+    elif event_type == "curse_cleared":
+        _pull(team, "active_curses", "title", data["curse"])
+    elif event_type == "wager_placed":
+        team["balance"] = team.get("balance", 0) + data.get("refunded", 0) - data["amount"]
+        team["trivia_wager"] = {"card": data["card"], "amount": data["amount"]}
+    elif event_type == "trivia_settled":
+        team.pop("trivia_wager", None)
+        team["balance"] = team.get("balance", 0) + data["payout"]
+        _pull(team, "hand", "title", data["card"])
+    else:
+        raise ValueError(f"Unknown event type {event_type!r}")
+
+
+def _pull(doc, field, key, value):
+    doc[field] = [item for item in doc.get(field, []) if item.get(key) != value]
+
+
+def _other_team(team):
+    return TEAMS[1 - TEAMS.index(team)]
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
@@ -0,0 +1,337 @@
+import secrets
+
+from pymongo import ReturnDocument
+
+import events
+import notifications
+from cards import CARDS, DRAW_COST, new_deck
+from snapshot import BUMP_VERSION
+
+RECENT_DEPOSIT_TOKENS = 20  # how many deposit tokens each team remembers for spotting retries
+
+# Takes the top card off the deck into the hand, charges for it and switches on
+# advantages, all inside one update. Every expression sees the document as it was
+# before the update, so they all agree on which card is on top.
+_DRAW_PIPELINE = [{"$set": {
+    "balance": {"$subtract": ["$balance", DRAW_COST]},
+    "hand": {"$concatArrays": [{"$ifNull": ["$hand", []]}, {"$slice": ["$deck", 1]}]},
+    "drawn_cards": {"$concatArrays": [{"$ifNull": ["$drawn_cards", []]}, {"$slice": ["$deck.id", 1]}]},
+    "gold_rush_active": {"$eq": [{"$arrayElemAt": ["$deck.type", 0]}, "advantage"]},
+    "deck": {"$slice": ["$deck", 1, len(CARDS)]},
+    "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+}}]
+
+
+def _transaction(collection, write):
+    """Runs write(session) as one multi-document transaction and returns what it returns.
+
+    with_transaction reruns write after a transient error such as a write conflict,
+    so write must do all its reads and writes through session.
+    """
+    with collection.database.client.start_session() as session:
+        return session.with_transaction(write)
+
+
+def _logged_write(collection, write):
+    """Runs write(session) and the events it records as one transaction when the event log is on.
+
+    With the log off, a single-document write is atomic by itself, so it runs
+    without a transaction (session is None).
+    """
+    if not events.EVENT_LOG_ENABLED:
+        return write(None)
+    return _transaction(collection, write)
+
+
+# Curses played with a number get it spelled out in the description the cursed team sees
+CURSE_VALUE_DESCRIPTIONS = {
+    "Curse of the Luxury Car": " Required MSRP to beat: ${value:,}",
+    "Curse of the Cairn": " You must stack {value} rocks to clear this curse.",
+    "Curse of the Bird Guide": " You must film a bird for more than {value} seconds to clear this curse.",
+}
+
+
+def build_curse(card, value=None):
+    """Turns a curse card (and the number a curse_with_input card asks for) into an active curse."""
+    curse_data = {"title": card["title"], "description": card["description"], "acknowledged": False}
+    if card["title"] in CURSE_VALUE_DESCRIPTIONS:
+        curse_data["description"] += CURSE_VALUE_DESCRIPTIONS[card["title"]].format(value=value)
+        curse_data["value"] = value
+    if card.get("link"):
+        curse_data["link"] = card["link"]
+    if card.get("auto_clear"):
+        curse_data["auto_clear"] = True
+    return curse_data
+
+
+def find_card(collection, team, title):
+    """Returns the card with this title from the team's hand, or None if they aren't holding it."""
+    doc = collection.find_one({"_id": team, "hand.title": title}, {"hand": {"$elemMatch": {"title": title}}})
+    return doc["hand"][0] if doc else None
+
+
+def send_curse(collection, team, other_team, card, curse_data):
+    """Takes the card out of our hand and puts its curse on the other team, in one transaction.
+
+    The pull only matches while the card is in our hand, so a double tap or a
+    second device sends the curse once. Returns False when the card had already
+    been played.
+    """
+    def write(session):
+        result = collection.update_one(
+            {"_id": team, "hand.title": card["title"]}, {"$pull": {"hand": {"title": card["title"]}}, "$inc": BUMP_VERSION}, session=session
+        )
+        if result.modified_count == 0:
+            return False
+        collection.update_one({"_id": other_team}, {"$push": {"active_curses": curse_data}, "$inc": BUMP_VERSION}, session=session)
+        events.record(collection, team, "curse_sent", session=session, card=card["title"], curse=curse_data)
+        return True
+
+    return _transaction(collection, write)
+
+
+def acknowledge_curse(collection, team, curse):
+    def write(session):
+        collection.update_one(
+            {"_id": team, "active_curses.title": curse["title"]},
+            {"$set": {"active_curses.$.acknowledged": True}, "$inc": BUMP_VERSION},
+            session=session,
+        )
+        events.record(collection, team, "curse_acknowledged", session=session, curse=curse["title"])
+
+    _logged_write(collection, write)
+
+
+def clear_curse(collection, team, other_team, curse, message):
+    """Removes a curse from our team and tells the other team through their notification feed, in one transaction."""
+    def write(session):
+        result = collection.update_one({"_id": team}, {"$pull": {"active_curses": {"title": curse["title"]}}, "$inc": BUMP_VERSION}, session=session)
+        if result.modified_count == 0:
+            # Already cleared from another device
+            return
+        notifications.notify(collection, other_team, message, session=session)
+        events.record(collection, team, "curse_cleared", session=session, curse=curse["title"])
+
+    _transaction(collection, write)
+
+
+def deposit(collection, team, zone, amount, token):
+    """Moves amount points from the team's balance into a zone with one conditional write.
+
+    The filter only matches while the balance covers the deposit and token hasn't
+    been used yet, so concurrent deposits can't overdraw and a double tap or
+    retried request is applied once. Returns (team document after the write, None)
+    or (None, error message).
+    """
+    if amount <= 0:
+        return None, "Please enter a deposit amount greater than 0."
+
+    projection = {"balance": 1, f"zone_{zone}": 1}
+
+    def write(session):
+        doc = collection.find_one_and_update(
+            {"_id": team, "balance": {"$gte": amount}, "deposit_tokens": {"$ne": token}},
+            {
+                "$inc": {"balance": -amount, f"zone_{zone}": amount, **BUMP_VERSION},
+                "$push": {"deposit_tokens": {"$each": [token], "$slice": -RECENT_DEPOSIT_TOKENS}},
+            },
+            projection=projection,
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        if doc is not None:
+            events.record(
+                collection, team, "deposit", session=session, zone=zone, amount=amount, token=token, recent_tokens=RECENT_DEPOSIT_TOKENS
+            )
+        return doc
+
+    doc = _logged_write(collection, write)
+    if doc is not None:
+        return doc, None
+
+    # Nothing matched: either this deposit already went through or the balance is too low
+    doc = collection.find_one({"_id": team, "deposit_tokens": token}, projection)
+    if doc is not None:
+        return doc, None
+    return None, "Not enough points for that deposit - your balance has changed."
+
+
+def complete_challenge(collection, team, challenge):
+    """Awards a challenge's points (x1.5 during a gold rush) and marks it completed in one write.
+
+    The filter only matches while the challenge isn't completed yet and the gold
+    rush state is the one the payout was worked out from. Returns (points awarded,
+    None) or (None, error message).
+    """
+    def write(session):
+        doc = collection.find_one({"_id": team}, {"gold_rush_active": 1}, session=session)
+        if doc is None:
+            return None, "Unknown team."
+        gold_rush = doc.get("gold_rush_active", False)
+        points = int(challenge["points"] * (1.5 if gold_rush else 1))
+
+        update = {"$inc": {"balance": points, **BUMP_VERSION}, "$addToSet": {"completed_challenges": challenge["id"]}}
+        if gold_rush:
+            update["$set"] = {"gold_rush_active": False}
+            update["$pull"] = {"hand": {"title": "Advantage: You struck gold!"}}
+        result = collection.update_one(
+            {"_id": team, "completed_challenges": {"$nin": [challenge["id"], challenge["title"]]}, "gold_rush_active": True if gold_rush else {"$ne": True}},
+            update,
+            session=session,
+        )
+        if result.modified_count == 0:
+            return None, "That challenge has already been completed."
+        events.record(collection, team, "challenge_completed", session=session, challenge=challenge["id"], points=points, gold_rush=gold_rush)
+        return points, None
+
+    return _logged_write(collection, write)
+
+
+def place_wager(collection, team, card, wager):
+    """Takes a trivia wager out of the balance and remembers it on the team document.
+
+    Only one card can have a wager on it at a time. Wagering on that card again
+    replaces the stake and refunds the old one. Returns None, or an error message
+    if the balance doesn't cover the wager or another card's wager is waiting.
+    """
+    if wager <= 0:
+        return "Please wager at least 1 point."
+
+    previous_stake = {"$ifNull": ["$trivia_wager.amount", 0]}
+
+    def write(session):
+        before = collection.find_one_and_update(
+            {
+                "_id": team,
+                "$or": [{"trivia_wager": {"$exists": False}}, {"trivia_wager.card": card["title"]}],
+                "$expr": {"$gte": [{"$add": ["$balance", previous_stake]}, wager]},
+            },
+            [{"$set": {
+                "balance": {"$subtract": [{"$add": ["$balance", previous_stake]}, wager]},
+                "trivia_wager": {"$literal": {"card": card["title"], "amount": wager}},
+                "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+            }}],
+            projection={"trivia_wager": 1},
+            session=session,
+        )
+        if before is None:
+            return False
+        refunded = before.get("trivia_wager", {}).get("amount", 0)
+        events.record(collection, team, "wager_placed", session=session, card=card["title"], amount=wager, refunded=refunded)
+        return True
+
+    if _logged_write(collection, write):
+        return None
+
+    # Nothing matched: read back which condition failed
+    doc = collection.find_one({"_id": team}, {"trivia_wager": 1})
+    if doc is None:
+        return "Your team wasn't found in this game."
+    if doc.get("trivia_wager", {}).get("card", card["title"]) != card["title"]:
+        return "Answer the trivia question you already wagered on first."
+    return "Not enough points for that wager - your balance has changed."
+
+
+def check_trivia_answer(card, answer):
+    if card["type"] == "risky_trivia":
+        return abs(answer - card["answer"]) <= card["tolerance"]
+    return answer == card["answer"]
+
+
+def answer_trivia(collection, team, card, answer):
+    """Settles the wager placed on card: the stake plus 3x back if the answer is right, nothing if not.
+
+    The payout, removing the wager and discarding the card are one update, which
+    only matches while the wager read for the payout is still there. Returns
+    (correct, wager) or (None, None) if no wager is waiting on this card.
+    """
+    def write(session):
+        doc = collection.find_one({"_id": team, "trivia_wager.card": card["title"]}, {"trivia_wager": 1}, session=session)
+        if doc is None:
+            return None, None
+        wager = doc["trivia_wager"]["amount"]
+        correct = check_trivia_answer(card, answer)
+        payout = wager * 4 if correct else 0
+        result = collection.update_one(
+            {"_id": team, "trivia_wager": doc["trivia_wager"]},
+            {"$unset": {"trivia_wager": ""}, "$inc": {"balance": payout, **BUMP_VERSION}, "$pull": {"hand": {"title": card["title"]}}},
+            session=session,
+        )
+        if result.modified_count == 0:
+            # Settled from another device in the meantime
+            return None, None
+        events.record(collection, team, "trivia_settled", session=session, card=card["title"], payout=payout)
+        return correct, wager
+
+    return _logged_write(collection, write)
+
+
+def new_deck_salt():
+    """A random salt for a game's shuffles, made once when the game is created."""
+    return secrets.token_hex(16)
+
+
+def deck_seed(game_id, team, salt):
+    """A seed for a team's shuffle.
+
+    salt is stored on the team document as deck_salt, so the same deck can be
+    rebuilt later, and never sent to players, so they can't work out the deck
+    order from the game id.
+    """
+    return f"{game_id}:{team}:{salt}"
+
+
+def draw_card(collection, game_id, team):
+    """Draws the top card of the team's server-side deck with one find_one_and_update.
+
+    The balance check, the 100 point charge and advantage activation happen in the
+    same write, so two phones can't draw the same card. Returns (updated hand and
+    balance, None) or (None, why the card couldn't be drawn).
+    """
+    draw_filter = {"_id": team, "balance": {"$gte": DRAW_COST}, "gold_rush_active": {"$ne": True}, "deck.0": {"$exists": True}}
+    projection = {"hand": 1, "balance": 1, "gold_rush_active": 1}
+
+    def write(session):
+        def draw():
+            return collection.find_one_and_update(
+                draw_filter, _DRAW_PIPELINE, projection=projection, return_document=ReturnDocument.AFTER, session=session
+            )
+
+        doc = draw()
+        if doc is None and _ensure_deck(collection, game_id, team, session):
+            doc = draw()
+        if doc is not None:
+            events.record(collection, team, "card_drawn", session=session, card=doc["hand"][-1], cost=DRAW_COST)
+        return doc
+
+    doc = _logged_write(collection, write)
+    if doc is not None:
+        return doc, None
+
+    # Nothing matched: read back which condition failed
+    doc = collection.find_one({"_id": team}, {"balance": 1, "gold_rush_active": 1, "deck": {"$slice": 1}})
+    if doc is None:
+        return None, "Your team wasn't found in this game."
+    if doc.get("gold_rush_active"):
+        return None, "Complete a challenge first - a gold rush is active."
+    if doc.get("balance", 0) < DRAW_COST:
+        return None, f"Not enough points to draw a card - it costs {DRAW_COST} pts."
+    return None, "No more cards available to draw!"
+
+
+def _ensure_deck(collection, game_id, team, session=None):
+    """Gives games created before server-side decks one, built from the cards they haven't drawn yet."""
+    doc = collection.find_one({"_id": team, "deck": {"$exists": False}}, {"drawn_cards": 1, "deck_salt": 1}, session=session)
+    if doc is None:
+        return False
+    salt = doc.get("deck_salt") or new_deck_salt()
+    deck = new_deck(deck_seed(game_id, team, salt), exclude=doc.get("drawn_cards", []))
+    result = collection.update_one(
+        {"_id": team, "deck": {"$exists": False}},
+        {"$set": {"deck": deck, "deck_salt": salt}, "$inc": BUMP_VERSION},
+        session=session,
+    )
+    if result.modified_count == 0:
+        return False
+    events.record(collection, team, "deck_built", session=session, deck=deck, salt=salt)
+    return bool(deck)
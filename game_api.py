@@ -0,0 +1,315 @@
+"""Small JSON API over game_actions, for bots, scripts and load tests.
+
+Run it next to the Streamlit app (it reads the same MONGO_URL / secrets):
+
+    python game_api.py --port 8502
+
+Endpoints, all JSON in and out:
+
+    GET  /leaderboard[?session=<session>]
+    GET  /games/<game>/state
+    POST /games/<game>/teams/<team>/deposit             {"zone": 3, "amount": 100, "token": "..."}
+                                                        (or "lat"/"lon" instead of "zone")
+    POST /games/<game>/teams/<team>/challenges          {"challenge": "<challenge id>"}
+    POST /games/<game>/teams/<team>/draw
+    POST /games/<game>/teams/<team>/curses              {"card": "<title>", "value": 5}
+    POST /games/<game>/teams/<team>/curses/acknowledge  {"curse": "<title>"}
+    POST /games/<game>/teams/<team>/curses/clear        {"curse": "<title>"}
+    POST /games/<game>/teams/<team>/trivia/wager        {"card": "<title>", "wager": 100}
+    POST /games/<game>/teams/<team>/trivia/answer       {"card": "<title>", "answer": 42}
+
+Failures come back as {"error": "..."} with a 4xx/5xx status.
+"""
+import argparse
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import game_actions
+import games
+import leaderboard
+from challenges import CHALLENGES_BY_ID
+from database import get_mongo_client
+from snapshot import TEAMS, load_snapshot
+from zones import get_zone_store
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8502
+MAX_BODY_BYTES = 16 * 1024
+KIND_NAMES = {int: "an integer", str: "a string", (int, float): "a number"}
+
+# Games are never deleted, so each one only has to be looked up in the registry once
+_known_games = set()
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _team_json(team):
+    if team is None:
+        return None
+    return {
+        "balance": team.balance,
+        "zones": {str(zone): points for zone, points in team.zones.items()},
+        "completed_challenges": list(team.completed_challenges),
+        "hand": list(team.hand),
+        "active_curses": list(team.active_curses),
+        "gold_rush_active": team.gold_rush_active,
+    }
+
+
+def _require(body, key, kind):
+    value = body.get(key)
+    # bool is an int subclass, but true/false is never a valid amount
+    if not isinstance(value, kind) or isinstance(value, bool):
+        raise ApiError(400, f"'{key}' must be {KIND_NAMES[kind]}")
+    return value
+
+
+def _held_card(collection, team, body):
+    card = game_actions.find_card(collection, team, _require(body, "card", str))
+    if card is None:
+        raise ApiError(409, "That card isn't in your hand.")
+    return card
+
+
+def _active_curse(collection, team, body):
+    title = _require(body, "curse", str)
+    doc = collection.find_one({"_id": team, "active_curses.title": title}, {"active_curses": {"$elemMatch": {"title": title}}})
+    if doc is None:
+        raise ApiError(409, "Your team doesn't have that curse.")
+    return doc["active_curses"][0]
+
+
+def get_state(collection, game_id, team, body):
+    snapshot = load_snapshot(collection)
+    return {"game": game_id, **{name: _team_json(snapshot.team(name)) for name in TEAMS}}
+
+
+def post_deposit(collection, game_id, team, body):
+    if "zone" in body:
+        zone = _require(body, "zone", int)
+        if zone not in get_zone_store().zone_ids:
+            raise ApiError(400, f"There is no zone {zone}.")
+    else:
+        zone, _ = get_zone_store().locate(float(_require(body, "lat", (int, float))), float(_require(body, "lon", (int, float))))
+        if zone is None:
+            raise ApiError(409, "That location isn't in a zone.")
+    doc, error = game_actions.deposit(collection, team, zone, _require(body, "amount", int), body.get("token") or uuid.uuid4().hex)
+    if error:
+        raise ApiError(409, error)
+    return {"zone": zone, "balance": doc["balance"], "zone_points": doc[f"zone_{zone}"]}
+
+
+def post_challenge(collection, game_id, team, body):
+    challenge = CHALLENGES_BY_ID.get(_require(body, "challenge", str))
+    if challenge is None:
+        raise ApiError(404, "Unknown challenge.")
+    points, error = game_actions.complete_challenge(collection, team, challenge)
+    if error:
+        raise ApiError(409, error)
+    return {"challenge": challenge["id"], "points": points}
+
+
+def post_draw(collection, game_id, team, body):
+    doc, error = game_actions.draw_card(collection, game_id, team)
+    if doc is None:
+        raise ApiError(409, error)
+    return {"card": doc["hand"][-1], "balance": doc["balance"], "gold_rush_active": doc.get("gold_rush_active", False)}
+
+
+def post_curse(collection, game_id, team, body):
+    card = _held_card(collection, team, body)
+    if card["type"] == "curse":
+        curse_data = game_actions.build_curse(card)
+    elif card["type"] == "curse_with_input":
+        curse_data = game_actions.build_curse(card, _require(body, "value", int))
+    else:
+        raise ApiError(400, "That card isn't a curse.")
+    other_team = TEAMS[1 - TEAMS.index(team)]
+    if not game_actions.send_curse(collection, team, other_team, card, curse_data):
+        raise ApiError(409, "That card isn't in your hand.")
+    return {"curse": curse_data, "cursed_team": other_team}
+
+
+def post_acknowledge_curse(collection, game_id, team, body):
+    curse = _active_curse(collection, team, body)
+    if curse.get("auto_clear", False):
+        return post_clear_curse(collection, game_id, team, body)
+    game_actions.acknowledge_curse(collection, team, curse)
+    return {"curse": curse["title"], "acknowledged": True}
+
+
+def post_clear_curse(collection, game_id, team, body):
+    curse = _active_curse(collection, team, body)
+    # As on the play screen, a curse can only be cleared once it has been acknowledged
+    if not (curse.get("auto_clear") or curse.get("acknowledged")):
+        raise ApiError(409, "Acknowledge that curse before clearing it.")
+    verb = "acknowledged" if curse.get("auto_clear", False) else "cleared"
+    other_team = TEAMS[1 - TEAMS.index(team)]
+    game_actions.clear_curse(collection, team, other_team, curse, f"The {team} team has {verb} the curse: {curse['title']}")
+    return {"curse": curse["title"], "cleared": True}
+
+
+def post_wager(collection, game_id, team, body):
+    card = _held_card(collection, team, body)
+    if "risky" not in card["type"]:
+        raise ApiError(400, "That card isn't a trivia card.")
+    wager = _require(body, "wager", int)
+    error = game_actions.place_wager(collection, team, card, wager)
+    if error:
+        raise ApiError(409, error)
+    return {"card": card["title"], "wager": wager, "question": card["question"], "options": card.get("options")}
+
+
+def post_answer(collection, game_id, team, body):
+    card = _held_card(collection, team, body)
+    answer = _require(body, "answer", int if card["type"] == "risky_trivia" else str)
+    correct, wager = game_actions.answer_trivia(collection, team, card, answer)
+    if correct is None:
+        raise ApiError(409, "Place a wager on that card first.")
+    return {"correct": correct, "wager": wager, "winnings": wager * 3 if correct else -wager}
+
+
+def get_leaderboard(db, query):
+    session = query.get("session", [None])[0]
+    return leaderboard.get_leaderboard(db, session)
+
+
+ROUTES = {("GET", ("leaderboard",)): get_leaderboard}
+GAME_ROUTES = {("GET", ("state",)): get_state}
+TEAM_ROUTES = {
+    ("POST", ("deposit",)): post_deposit,
+    ("POST", ("challenges",)): post_challenge,
+    ("POST", ("draw",)): post_draw,
+    ("POST", ("curses",)): post_curse,
+    ("POST", ("curses", "acknowledge")): post_acknowledge_curse,
+    ("POST", ("curses", "clear")): post_clear_curse,
+    ("POST", ("trivia", "wager")): post_wager,
+    ("POST", ("trivia", "answer")): post_answer,
+}
+
+
+def _parse_body(data):
+    if not data:
+        return {}
+    try:
+        body = json.loads(data)
+    except ValueError:
+        raise ApiError(400, "Request body must be JSON.")
+    if not isinstance(body, dict):
+        raise ApiError(400, "Request body must be a JSON object.")
+    return body
+
+
+def resolve(method, path):
+    """Maps a request path to (handler, game id, team), raising ApiError(404) if nothing matches.
+
+    Handlers in ROUTES aren't about one game and come back with game id None.
+    """
+    parts = tuple(unquote(part) for part in urlsplit(path).path.split("/") if part)
+    if (method, parts) in ROUTES:
+        return ROUTES[(method, parts)], None, None
+    if len(parts) >= 3 and parts[0] == "games":
+        game_id, rest = parts[1], parts[2:]
+        if (method, rest) in GAME_ROUTES:
+            return GAME_ROUTES[(method, rest)], game_id, None
+        if len(rest) >= 3 and rest[0] == "teams" and rest[1] in TEAMS and (method, rest[2:]) in TEAM_ROUTES:
+            return TEAM_ROUTES[(method, rest[2:])], game_id, rest[1]
+    raise ApiError(404, "Not found.")
+
+
+class GameApiHandler(BaseHTTPRequestHandler):
+    server_version = "OttawaGameAPI/1.0"
+    protocol_version = "HTTP/1.1"  # keep-alive, so load tests don't pay for a new connection per call
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        started = time.perf_counter()
+        try:
+            # Read the body before anything can fail, so keep-alive never parses leftovers as the next request
+            data = self._read_body()
+            handler, game_id, team = resolve(method, self.path)
+            body = _parse_body(data)
+            client, error = get_mongo_client()
+            if client is None:
+                raise ApiError(503, error)
+            db = client[games.DATABASE_NAME]
+            if game_id is None:
+                payload = handler(db, parse_qs(urlsplit(self.path).query))
+            else:
+                if game_id not in _known_games:
+                    if not games.game_exists(db, game_id):
+                        raise ApiError(404, "No such game - join it from the app or provision it first.")
+                    _known_games.add(game_id)
+                payload = handler(db[game_id], game_id, team, body)
+            status = 200
+        except ApiError as e:
+            status, payload = e.status, {"error": str(e)}
+        except Exception as e:
+            status, payload = 500, {"error": f"Unexpected error: {e}"}
+        self._send(status, payload, time.perf_counter() - started)
+
+    def _read_body(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length < 0:
+                raise ValueError(length)
+        except ValueError:
+            self.close_connection = True
+            raise ApiError(400, "Invalid Content-Length.")
+        if length > MAX_BODY_BYTES:
+            # Too big to drain, so the connection can't be reused
+            self.close_connection = True
+            raise ApiError(413, "Request body too large.")
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status, payload, elapsed):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Server-Timing", f"app;dur={elapsed * 1000:.2f}")
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Per-request access logs would cost more than most requests do
+        pass
+
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    return ThreadingHTTPServer((host, port), GameApiHandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the Ottawa game actions as a JSON API.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port)
+    print(f"Game API listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
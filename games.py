@@ -0,0 +1,150 @@
+"""The games registry: one small document per game in the "games" collection.
+
+Each game still keeps its two team documents in a collection named after the
+game. The registry is keyed on the game id (the _id index is unique), so
+checking whether a game exists is one indexed point read however many games
+have been played.
+
+Admins can provision a whole session's games up front:
+
+    python games.py camp-2025-week1 --count 12
+    python games.py camp-2025-week1 maple spruce birch
+"""
+import argparse
+import datetime
+
+import pymongo
+from pymongo import UpdateOne
+
+import events
+import notifications
+from cards import new_deck
+from game_actions import deck_seed, new_deck_salt
+from snapshot import REGISTRY_COLLECTION, TEAMS, ZONE_FIELDS
+
+DATABASE_NAME = "ottawa-game"
+# Collections shared by every game, which a game id must not collide with
+RESERVED_COLLECTIONS = {
+    REGISTRY_COLLECTION,
+    events.EVENTS_COLLECTION,
+    events.SNAPSHOTS_COLLECTION,
+    notifications.NOTIFICATIONS_COLLECTION,
+}
+
+
+def validate_game_id(game_id):
+    """Returns an error message if game_id can't be used as a game's collection name, otherwise None."""
+    if not game_id:
+        return "Please enter a game ID."
+    if game_id in RESERVED_COLLECTIONS or game_id.startswith("system."):
+        return f"'{game_id}' is reserved, please pick another game ID."
+    if "$" in game_id:
+        return "Game IDs can't contain '$'."
+    if "\0" in game_id:
+        return "Game IDs can't contain a null character."
+    if game_id.startswith("."):
+        return "Game IDs can't start with '.'."
+    if game_id.endswith("."):
+        return "Game IDs can't end with '.'."
+    if ".." in game_id:
+        return "Game IDs can't contain '..'."
+    return None
+
+
+def new_team_document(game_id, team, salt):
+    """The starting state of one team, without its _id. salt is the game's deck salt."""
+    team_data = {"balance": 0}
+    # Add zones 1-9
+    team_data.update(dict.fromkeys(ZONE_FIELDS, 0))
+    # Add completed challenges list
+    team_data["completed_challenges"] = []
+    # Add card-related fields
+    team_data["hand"] = []
+    team_data["drawn_cards"] = []
+    team_data["active_curses"] = []
+    team_data["gold_rush_active"] = False
+    team_data["deck_salt"] = salt
+    team_data["deck"] = new_deck(deck_seed(game_id, team, salt))
+    return team_data
+
+
+def _team_upserts(game_id):
+    # $setOnInsert leaves a team that already exists untouched, so repeating this is harmless
+    salt = new_deck_salt()
+    return [UpdateOne({"_id": team}, {"$setOnInsert": new_team_document(game_id, team, salt)}, upsert=True) for team in TEAMS]
+
+
+def _registry_entry(session=None):
+    entry = {"created_at": datetime.datetime.now(datetime.timezone.utc)}
+    if session:
+        entry["session"] = session
+    return {"$setOnInsert": entry}
+
+
+def game_exists(db, game_id):
+    return db[REGISTRY_COLLECTION].find_one({"_id": game_id}, {"_id": 1}) is not None
+
+
+def ensure_game(db, game_id):
+    """Registers game_id and creates its team documents if this is the first join.
+
+    Everything is an upsert, so devices pressing "Go!" at the same time all end up
+    with the same single game, and games created before the registry existed are
+    registered without touching their teams. Returns True if the game was new.
+    """
+    if game_exists(db, game_id):
+        return False
+    db[game_id].bulk_write(_team_upserts(game_id), ordered=False)
+    events.start_log(db, game_id)
+    try:
+        result = db[REGISTRY_COLLECTION].update_one({"_id": game_id}, _registry_entry(), upsert=True)
+    except pymongo.errors.DuplicateKeyError:
+        # Another device's upsert won the race on the unique _id
+        return False
+    return result.upserted_id is not None
+
+
+def provision_games(db, game_ids, session=None):
+    """Creates many games at once: one bulk write to the registry plus one per game for its teams.
+
+    Games that already exist are left as they are. Returns the ids that were new.
+    """
+    game_ids = list(dict.fromkeys(game_ids))
+    for game_id in game_ids:
+        error = validate_game_id(game_id)
+        if error:
+            raise ValueError(error)
+
+    # The leaderboard looks games up by session
+    db[REGISTRY_COLLECTION].create_index("session")
+    for game_id in game_ids:
+        db[game_id].bulk_write(_team_upserts(game_id), ordered=False)
+        events.start_log(db, game_id)
+    result = db[REGISTRY_COLLECTION].bulk_write(
+        [UpdateOne({"_id": game_id}, _registry_entry(session), upsert=True) for game_id in game_ids], ordered=False
+    )
+    return [game_ids[index] for index in sorted(result.upserted_ids)]
+
+
+def main():
+    from database import get_mongo_client
+
+    parser = argparse.ArgumentParser(description="Provision a session's worth of games.")
+    parser.add_argument("session", help="label stored on every game, e.g. camp-2025-week1")
+    parser.add_argument("game_ids", nargs="*", help="game ids to create (default: <session>-1 ... <session>-N)")
+    parser.add_argument("--count", type=int, default=0, help="number of numbered games to create")
+    args = parser.parse_args()
+
+    game_ids = args.game_ids or [f"{args.session}-{n}" for n in range(1, args.count + 1)]
+    if not game_ids:
+        parser.error("give some game ids or --count")
+
+    client, error = get_mongo_client()
+    if client is None:
+        raise SystemExit(f"Database connection failed: {error}")
+    created = provision_games(client[DATABASE_NAME], game_ids, args.session)
+    print(f"Created {len(created)} of {len(game_ids)} games: {', '.join(created) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Standings across every registered game, for organizers.
+
+One aggregation ($unionWith over the game collections) computes each team's
+balance, total deposited points, challenges completed and points per zone; zone
+wins are worked out from the two teams' zone totals. Results are cached per
+process for LEADERBOARD_TTL seconds, so any number of organizer screens polling
+the leaderboard cost one refresh per interval. A refresh first reads every team
+document's version (bumped by each write to it) and only re-aggregates games
+where one of them has moved since the last refresh.
+"""
+import datetime
+import threading
+import time
+
+from games import REGISTRY_COLLECTION
+from snapshot import TEAMS, ZONE_FIELDS
+
+LEADERBOARD_TTL = 15  # seconds a computed leaderboard is served before refreshing
+GAMES_PER_AGGREGATION = 50  # keeps each $unionWith pipeline a reasonable size
+
+_leaderboards = {}
+_leaderboards_lock = threading.Lock()
+
+
+def _team_stats_pipeline(game_id):
+    return [
+        {"$match": {"_id": {"$in": list(TEAMS)}}},
+        {"$project": {
+            "_id": 0,
+            "game": {"$literal": game_id},
+            "team": "$_id",
+            "balance": {"$ifNull": ["$balance", 0]},
+            **{field: {"$ifNull": [f"${field}", 0]} for field in ZONE_FIELDS},
+            "deposited": {"$add": [{"$ifNull": [f"${field}", 0]} for field in ZONE_FIELDS]},
+            "challenges": {"$size": {"$ifNull": ["$completed_challenges", []]}},
+        }},
+    ]
+
+
+def _team_versions_pipeline(game_id):
+    return [
+        {"$match": {"_id": {"$in": list(TEAMS)}}},
+        {"$project": {"_id": 0, "game": {"$literal": game_id}, "team": "$_id", "version": {"$ifNull": ["$version", 0]}}},
+    ]
+
+
+def _union(db, game_ids, build_pipeline):
+    first, *rest = game_ids
+    pipeline = build_pipeline(first)
+    for game_id in rest:
+        pipeline.append({"$unionWith": {"coll": game_id, "pipeline": build_pipeline(game_id)}})
+    return list(db[first].aggregate(pipeline))
+
+
+def aggregate_team_stats(db, game_ids):
+    """Runs one aggregation over the given games' collections and returns their team rows."""
+    return _union(db, game_ids, _team_stats_pipeline)
+
+
+def team_versions(db, game_ids):
+    """Returns {game id: (version of each team document, in TEAMS order)} for the given games."""
+    versions = {game_id: dict.fromkeys(TEAMS, 0) for game_id in game_ids}
+    for start in range(0, len(game_ids), GAMES_PER_AGGREGATION):
+        for row in _union(db, game_ids[start:start + GAMES_PER_AGGREGATION], _team_versions_pipeline):
+            versions[row["game"]][row["team"]] = row["version"]
+    return {game_id: tuple(teams.values()) for game_id, teams in versions.items()}
+
+
+def _game_row(game_id, session, team_rows):
+    teams = {}
+    for row in team_rows:
+        teams[row["team"]] = {
+            "balance": row["balance"],
+            "zones": [row[field] for field in ZONE_FIELDS],
+            "deposited": row["deposited"],
+            "challenges": row["challenges"],
+        }
+    for team in TEAMS:
+        teams.setdefault(team, {"balance": 0, "zones": [0] * len(ZONE_FIELDS), "deposited": 0, "challenges": 0})
+    for team, other in (TEAMS, TEAMS[::-1]):
+        teams[team]["zones_won"] = sum(mine > theirs for mine, theirs in zip(teams[team]["zones"], teams[other]["zones"]))
+
+    def standing(team):
+        return teams[team]["zones_won"], teams[team]["deposited"]
+
+    leader = max(TEAMS, key=standing)
+    if standing(TEAMS[0]) == standing(TEAMS[1]):
+        leader = None
+    return {
+        "game": game_id,
+        "session": session,
+        "leader": leader,
+        "teams": teams,
+    }
+
+
+class Leaderboard:
+    """The cached standings for one set of games (every game, or one session's)."""
+
+    def __init__(self, session=None):
+        self.session = session
+        self.result = None
+        self._rows = {}
+        self._versions = {}
+        self._refreshed_at = 0
+        self._refresh_lock = threading.Lock()
+
+    def get(self, db, ttl=LEADERBOARD_TTL):
+        if self.result is not None and time.monotonic() - self._refreshed_at < ttl:
+            return self.result
+        # Only one viewer refreshes; everyone else keeps getting the previous result meanwhile
+        if not self._refresh_lock.acquire(blocking=self.result is None):
+            return self.result
+        try:
+            if self.result is None or time.monotonic() - self._refreshed_at >= ttl:
+                self._refresh(db)
+        finally:
+            self._refresh_lock.release()
+        return self.result
+
+    def _refresh(self, db):
+        registry_filter = {"session": self.session} if self.session else {}
+        registered = {entry["_id"]: entry for entry in db[REGISTRY_COLLECTION].find(registry_filter, {"session": 1})}
+
+        versions = team_versions(db, list(registered))
+        changed = [game_id for game_id in registered if self._versions.get(game_id) != versions[game_id]]
+        team_rows = {game_id: [] for game_id in changed}
+        for start in range(0, len(changed), GAMES_PER_AGGREGATION):
+            for row in aggregate_team_stats(db, changed[start:start + GAMES_PER_AGGREGATION]):
+                team_rows[row["game"]].append(row)
+
+        for game_id in changed:
+            self._rows[game_id] = _game_row(game_id, registered[game_id].get("session"), team_rows[game_id])
+            self._versions[game_id] = versions[game_id]
+        for game_id in set(self._rows) - set(registered):
+            del self._rows[game_id]
+            self._versions.pop(game_id, None)
+
+        self._refreshed_at = time.monotonic()
+        self.result = {
+            "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "games_refreshed": len(changed),
+            "games": sorted(self._rows.values(), key=lambda row: row["game"]),
+        }
+
+
+def get_leaderboard(db, session=None, ttl=LEADERBOARD_TTL):
+    """Returns the (cached) standings of every registered game, or only those in session."""
+    key = (db.name, session)
+    with _leaderboards_lock:
+        leaderboard = _leaderboards.get(key)
+        if leaderboard is None:
+            leaderboard = _leaderboards[key] = Leaderboard(session)
+    return leaderboard.get(db, ttl)
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pymongo
+
+from snapshot import TEAMS
+
+POLL_INTERVAL = 1  # seconds between polls when change streams aren't available
+IDLE_TIMEOUT = 600  # a watcher nobody has asked about for this long shuts itself down
+MAX_RETRY_BACKOFF = 30
+# "The $changeStream stage is only supported on replica sets": a standalone server, so poll instead
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+class GameWatcher:
+    """Follows one game's team documents and counts how often each one changes.
+
+    A single watcher per game is shared by every session in the process. It uses a
+    change stream when the server is a replica set (a local single-node one is
+    enough) and falls back to polling the team documents otherwise. Sessions compare
+    version(team) with the value they rendered and only rerun when it moved.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.mode = None
+        self._versions = dict.fromkeys(TEAMS, 0)
+        # Where the change stream got to, so a reopened stream carries on from there
+        self._resume_token = None
+        self._last_used = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name=f"live-sync-{collection.name}", daemon=True)
+        self._thread.start()
+
+    def version(self, team):
+        self._last_used = time.monotonic()
+        return self._versions[team]
+
+    def _bump(self, team):
+        if team in self._versions:
+            self._versions[team] += 1
+
+    def _bump_all(self):
+        for team in TEAMS:
+            self._bump(team)
+
+    def _idle(self):
+        return time.monotonic() - self._last_used > IDLE_TIMEOUT
+
+    def _run(self):
+        backoff = 1
+        while not self._idle():
+            try:
+                if self.mode != "poll":
+                    self._watch_changes()
+                else:
+                    self._poll()
+                backoff = 1
+            except pymongo.errors.OperationFailure as e:
+                if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    self.mode = "poll"
+                    continue
+                # Any other failure (e.g. ChangeStreamHistoryLost) may have cost us changes and
+                # the resume token may be unusable, so have every session reload, then reopen
+                # the stream from now
+                self._resume_token = None
+                self._bump_all()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, MAX_RETRY_BACKOFF)
+            except pymongo.errors.PyMongoError:
+                # A dropped connection: a change stream picks up where it left off from its
+                # resume token; without one (or while polling) changes may have been missed
+                if self.mode == "poll" or self._resume_token is None:
+                    self._bump_all()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, MAX_RETRY_BACKOFF)
+        with _watchers_lock:
+            if _watchers.get(self.collection.full_name) is self:
+                del _watchers[self.collection.full_name]
+
+    def _watch_changes(self):
+        pipeline = [{"$match": {"documentKey._id": {"$in": list(TEAMS)}}}]
+        with self.collection.watch(pipeline, max_await_time_ms=POLL_INTERVAL * 1000, resume_after=self._resume_token) as stream:
+            self.mode = "change_stream"
+            while stream.alive and not self._idle():
+                change = stream.try_next()
+                if change is not None:
+                    self._bump(change["documentKey"]["_id"])
+                self._resume_token = stream.resume_token
+
+    def _poll(self):
+        last_seen = {}
+        while not self._idle():
+            for doc in self.collection.find({"_id": {"$in": list(TEAMS)}}, {"deck": 0}):
+                if doc["_id"] in last_seen and last_seen[doc["_id"]] != doc:
+                    self._bump(doc["_id"])
+                last_seen[doc["_id"]] = doc
+            time.sleep(POLL_INTERVAL)
+
+
+def get_game_watcher(collection):
+    """Returns the shared watcher for a game's collection, starting one if needed."""
+    with _watchers_lock:
+        watcher = _watchers.get(collection.full_name)
+        if watcher is None or watcher._idle() or not watcher._thread.is_alive():
+            watcher = _watchers[collection.full_name] = GameWatcher(collection)
+    return watcher
@@ -0,0 +1,53 @@
+"""The phone's position, streamed by a small custom component instead of one-shot lookups.
+
+The component (components/location_stream/index.html) keeps a watchPosition
+running in the browser, drops inaccurate fixes, debounces the rest and only
+reports a fix once the phone has moved further than the threshold the script
+passes in. The script sets that threshold to ZoneStore.stable_distance(), how far
+the phone can go before the zone it is in (or snapped to) can change, capped at
+MOVE_THRESHOLD. So every zone change is reported, while walking around well
+inside a zone doesn't rerun the page. Near the line where two zones meet the
+threshold drops towards 0, and reruns are then limited by DEBOUNCE_MS.
+
+benchmarks/location_walk.py replays simulated walks through the zones to count
+the reruns and how long the shown zone lags the true one.
+"""
+import os
+
+import streamlit.components.v1 as components
+
+COMPONENT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "location_stream")
+LOCATION_KEY = "location_stream"
+DEBOUNCE_MS = 3000  # at most one report per this many milliseconds
+MAX_ACCURACY = 75  # metres; fixes less accurate than this are dropped once there is a position
+MOVE_THRESHOLD = 30  # metres moved before a new position is reported
+
+_component = components.declare_component(LOCATION_KEY, path=COMPONENT_PATH)
+
+
+def movement_threshold(stable_distance):
+    """Metres the phone has to move before it is worth a rerun, given ZoneStore.stable_distance()."""
+    if stable_distance is None:
+        return MOVE_THRESHOLD
+    return min(MOVE_THRESHOLD, stable_distance)
+
+
+def location_stream(threshold, request_seq=0, key=LOCATION_KEY):
+    """Renders the (invisible) location component and returns the last fix it reported, or None.
+
+    A fix is {"seq", "lat", "lon", "accuracy", "at"}; a failure is {"seq", "error", "code"}.
+    Bumping request_seq asks for a fresh fix that is reported even without movement.
+    """
+    return _component(
+        threshold_m=threshold,
+        debounce_ms=DEBOUNCE_MS,
+        max_accuracy_m=MAX_ACCURACY,
+        request_seq=request_seq,
+        key=key,
+        default=None,
+    )
+
+
+def latest_report(session_state, key=LOCATION_KEY):
+    """The last fix or error the component sent, readable before the component is drawn in this rerun."""
+    return session_state.get(key)
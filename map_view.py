@@ -0,0 +1,320 @@
+import json
+import os
+from functools import lru_cache
+
+import folium
+from branca.element import MacroElement
+from jinja2 import Template
+from shapely.geometry import mapping
+
+from challenges import CHALLENGES_BY_ID
+from render_cache import render_cache
+
+CENTRE = {"lat": 45.4248, "lon": -75.69522}
+# Override to point the map at another tile server, e.g. benchmarks/tile_server.py
+TILE_URL = os.environ.get("TILE_URL", "https://api.maptiler.com/maps/voyager/{z}/{x}/{y}.png?key=")
+TILE_ATTRIBUTION = '<a href="https://www.maptiler.com/copyright/" target="_blank">&copy; MapTiler</a>'
+
+# "geojson" ships zones and challenges as two FeatureCollections styled in the
+# browser; "layers" ships a style per zone and a marker per challenge. Both take
+# their popup HTML from the render caches
+MAP_RENDER_MODE = "geojson"
+
+
+def rgb_to_hex_fstring(r, g, b):
+    """Converts RGB values (0-255) to a hexadecimal color code string."""
+    return f'#{r:02X}{g:02X}{b:02X}'
+
+
+# Function to determine zone color based on team points
+def get_zone_color(zone_number, orange_data, pink_data):
+    if orange_data and pink_data:
+        orange_points = orange_data.zone_points(zone_number)
+        pink_points = pink_data.zone_points(zone_number)
+
+        if orange_points > pink_points:
+            return rgb_to_hex_fstring(255, 150, 0)  # Orange team winning
+        elif pink_points > orange_points:
+            return rgb_to_hex_fstring(255, 0, 150)  # Pink team winning
+        else:
+            return rgb_to_hex_fstring(255, 75, 75)  # Tie
+    else:
+        return rgb_to_hex_fstring(255, 75, 75)  # Default color if no data
+
+
+# Function to create popup HTML with team scores
+def create_popup_html(zone_number, orange_data, pink_data):
+    orange_points = orange_data.zone_points(zone_number) if orange_data else 0
+    pink_points = pink_data.zone_points(zone_number) if pink_data else 0
+    return zone_popup_html(zone_number, orange_points, pink_points)
+
+
+# Nine zones times a handful of score combinations each between deposits
+@render_cache("zone_popup", maxsize=256)
+def zone_popup_html(zone_number, orange_points, pink_points):
+    html = f"""
+    <div style="font-family: Arial, sans-serif; min-width: 150px;">
+        <h4 style="margin: 0; text-align: center;">Zone {zone_number}</h4>
+        <div style="margin: 10px 0;">
+            <div style="color: #FF9600; font-weight: bold;">🧡 Orange: {orange_points}</div>
+            <div style="color: #FF0096; font-weight: bold;">🩷 Pink: {pink_points}</div>
+        </div>
+    </div>
+    """
+    return html
+
+
+def trophy_colour(points):
+    """Gold, silver or bronze depending on how much a challenge is worth."""
+    return "FFD700" if points >= 300 else "C0C0C0" if points >= 200 else "CD7F32"
+
+
+def challenge_popup_html(challenge):
+    return _challenge_popup_html(challenge["id"])
+
+
+@render_cache("challenge_popup", maxsize=64)
+def _challenge_popup_html(challenge_id):
+    challenge = CHALLENGES_BY_ID[challenge_id]
+    return f"""<b style="text-align: center;"><h3>{challenge['location']}</h3>{challenge['title']}</b><br><i>Points: {challenge['points']}</i><br>{challenge['challenge']}<br><a href='{challenge['link']}' target='_blank'>View on Google Maps</a>"""
+
+
+def zone_style(color, highlighted, popup_html):
+    """Per-rerun styling for one zone in "layers" mode; the nearest zone is drawn bolder."""
+    return {
+        "options": {
+            "color": color,
+            "fill": True,
+            "fillOpacity": 0.6 if highlighted else 0.3,
+            "weight": 5 if highlighted else 3,
+        },
+        "popup": popup_html,
+    }
+
+
+@lru_cache(maxsize=8)
+def _zone_geometry_json(zone_store):
+    # Keyed on the store itself, so a reloaded KML gets fresh geometry
+    return json.dumps([zone_store.leaflet_coords[zone_number] for zone_number in zone_store])
+
+
+@lru_cache(maxsize=8)
+def _zone_features_json(zone_store):
+    features = [
+        {"type": "Feature", "properties": {"zone": zone_number}, "geometry": mapping(zone_store.polygons[zone_number])}
+        for zone_number in zone_store
+    ]
+    return json.dumps({"type": "FeatureCollection", "features": features})
+
+
+@lru_cache(maxsize=64)
+def _challenge_markers_json(visible_challenges):
+    markers = []
+    for challenge_id in visible_challenges:
+        challenge = CHALLENGES_BY_ID[challenge_id]
+        markers.append({
+            "location": [challenge["lat"], challenge["lon"]],
+            "icon": f'<i class="fa-solid fa-trophy" style="color: #{trophy_colour(challenge["points"])}; font-size: 25px;"></i>',
+            "popup": challenge_popup_html(challenge),
+        })
+    return json.dumps(markers)
+
+
+@lru_cache(maxsize=64)
+def _challenge_features_json(visible_challenges):
+    features = []
+    for challenge_id in visible_challenges:
+        challenge = CHALLENGES_BY_ID[challenge_id]
+        properties = {"id": challenge_id, "colour": trophy_colour(challenge["points"]), "popup": challenge_popup_html(challenge)}
+        features.append({
+            "type": "Feature",
+            "properties": properties,
+            "geometry": {"type": "Point", "coordinates": [challenge["lon"], challenge["lat"]]},
+        })
+    return json.dumps({"type": "FeatureCollection", "features": features})
+
+
+class ZoneLayer(MacroElement):
+    """Every zone polygon as one map element.
+
+    The geometry is serialized once per process; each rerun only supplies the
+    per-zone style and popup HTML.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function(map, zones, styles) {
+            zones.forEach(function(locations, i) {
+                var popup = document.createElement("div");
+                popup.innerHTML = styles[i].popup;
+                L.polygon(locations, styles[i].options).bindPopup(popup, {maxWidth: 200}).addTo(map);
+            });
+        })({{ this._parent.get_name() }}, {{ this.geometry }}, {{ this.styles }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, zone_store, zone_styles):
+        super().__init__()
+        self._name = "ZoneLayer"
+        self.geometry = _zone_geometry_json(zone_store)
+        self.styles = json.dumps(zone_styles)
+
+
+class ChallengeLayer(MacroElement):
+    """The trophy markers for a set of challenges as one map element, serialized once per set."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function(map, markers) {
+            markers.forEach(function(marker) {
+                var popup = document.createElement("div");
+                popup.innerHTML = marker.popup;
+                L.marker(marker.location, {
+                    icon: L.divIcon({html: marker.icon, iconSize: [24, 16], iconAnchor: [12, 8], className: "empty"})
+                }).bindPopup(popup, {maxWidth: 300}).addTo(map);
+            });
+        })({{ this._parent.get_name() }}, {{ this.markers }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, visible_challenges):
+        super().__init__()
+        self._name = "ChallengeLayer"
+        self.markers = _challenge_markers_json(tuple(visible_challenges))
+
+
+class ZoneFeatures(MacroElement):
+    """The zones as one GeoJSON layer, coloured in the browser from their scores.
+
+    The style function mirrors get_zone_color; the popups come from create_popup_html.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function(map, zones, scores, popups, nearest) {
+            function colour(p) {
+                if (p.orange === null || p.pink === null) return "#FF4B4B";
+                if (p.orange > p.pink) return "#FF9600";
+                if (p.pink > p.orange) return "#FF0096";
+                return "#FF4B4B";
+            }
+            function popup(p) {
+                var div = document.createElement("div");
+                div.innerHTML = p.popup;
+                return div;
+            }
+            zones.features.forEach(function(feature, i) {
+                feature.properties.orange = scores[i][0];
+                feature.properties.pink = scores[i][1];
+                feature.properties.popup = popups[i];
+            });
+            L.geoJSON(zones, {
+                style: function(feature) {
+                    var highlighted = feature.properties.zone === nearest;
+                    return {color: colour(feature.properties), fill: true, fillOpacity: highlighted ? 0.6 : 0.3, weight: highlighted ? 5 : 3};
+                },
+                onEachFeature: function(feature, layer) {
+                    layer.bindPopup(popup(feature.properties), {maxWidth: 200});
+                }
+            }).addTo(map);
+        })({{ this._parent.get_name() }}, {{ this.zones }}, {{ this.scores }}, {{ this.popups }}, {{ this.nearest }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, zone_store, orange_data, pink_data, nearest_zone):
+        super().__init__()
+        self._name = "ZoneFeatures"
+        self.zones = _zone_features_json(zone_store)
+        # null stands in for a team with no document yet
+        self.scores = json.dumps([
+            [team.zone_points(zone_number) if team else None for team in (orange_data, pink_data)]
+            for zone_number in zone_store
+        ])
+        self.popups = json.dumps([create_popup_html(zone_number, orange_data, pink_data) for zone_number in zone_store])
+        self.nearest = json.dumps(nearest_zone)
+
+
+class ChallengeFeatures(MacroElement):
+    """The challenges as one GeoJSON layer sharing an icon per trophy colour, with challenge_popup_html's popups."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function(map, challenges) {
+            var icons = {};
+            function icon(colour) {
+                if (!icons[colour]) {
+                    icons[colour] = L.divIcon({
+                        html: '<i class="fa-solid fa-trophy" style="color: #' + colour + '; font-size: 25px;"></i>',
+                        iconSize: [24, 16], iconAnchor: [12, 8], className: "empty"
+                    });
+                }
+                return icons[colour];
+            }
+            function popup(p) {
+                var div = document.createElement("div");
+                div.innerHTML = p.popup;
+                return div;
+            }
+            L.geoJSON(challenges, {
+                pointToLayer: function(feature, latlng) {
+                    return L.marker(latlng, {icon: icon(feature.properties.colour)});
+                },
+                onEachFeature: function(feature, layer) {
+                    layer.bindPopup(popup(feature.properties), {maxWidth: 300});
+                }
+            }).addTo(map);
+        })({{ this._parent.get_name() }}, {{ this.challenges }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, visible_challenges):
+        super().__init__()
+        self._name = "ChallengeFeatures"
+        self.challenges = _challenge_features_json(tuple(visible_challenges))
+
+
+def build_map(zone_store, orange_data, pink_data, nearest_zone, visible_challenges, tile_url, user_location=None, mode=MAP_RENDER_MODE):
+    """Assembles the game map from the cached static layers plus this rerun's scores.
+
+    visible_challenges holds the ids of the challenges to draw, and tile_url is the
+    tile template (tile_proxy.map_tile_url()).
+    """
+    m = folium.Map(
+        min_zoom=5,
+        location=[CENTRE["lat"], CENTRE["lon"]],  # Always center on Ottawa initially
+        zoom_start=14,
+    )
+
+    # Only show location marker if we have real coordinates
+    if user_location is not None:
+        folium.Marker(
+            location=list(user_location),
+            icon=folium.DivIcon(
+                html='<i class="fa fa-location-crosshairs" style="color: #0050ff; font-size: 20px;"></i>',
+                icon_size=(25, 25),
+                icon_anchor=(12.5, 12.5)
+            )
+        ).add_to(m)
+
+    if mode == "geojson":
+        ZoneFeatures(zone_store, orange_data, pink_data, nearest_zone).add_to(m)
+        ChallengeFeatures(visible_challenges).add_to(m)
+    else:
+        zone_styles = [
+            zone_style(
+                get_zone_color(zone_number, orange_data, pink_data),
+                nearest_zone == zone_number,
+                create_popup_html(zone_number, orange_data, pink_data),
+            )
+            for zone_number in zone_store
+        ]
+        ZoneLayer(zone_store, zone_styles).add_to(m)
+        ChallengeLayer(visible_challenges).add_to(m)
+
+    folium.TileLayer(
+        tiles=tile_url,
+        attr=TILE_ATTRIBUTION,
+        min_zoom=13,
+        max_zoom=21,
+    ).add_to(m)
+    return m
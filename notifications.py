@@ -0,0 +1,70 @@
+"""Messages for a team (e.g. "the pink team has cleared your curse"), kept outside the team documents.
+
+Entries live in one shared "notifications" collection and expire after
+NOTIFICATION_TTL. Each team document only carries notification_seq, the seq of
+its newest entry. The rerun reads the snapshot it already fetches, compares that
+counter with the session's cursor, and only queries for entries when there is
+something new.
+"""
+import datetime
+
+from pymongo import ReturnDocument
+
+from snapshot import BUMP_VERSION
+
+NOTIFICATIONS_COLLECTION = "notifications"
+NOTIFICATION_TTL = 12 * 60 * 60  # a game never lasts longer than this
+MAX_NOTIFICATIONS_PER_READ = 20
+
+_indexed = set()
+
+
+def _ensure_indexes(db):
+    if db.name not in _indexed:
+        db[NOTIFICATIONS_COLLECTION].create_index([("game", 1), ("team", 1), ("seq", 1)], unique=True)
+        db[NOTIFICATIONS_COLLECTION].create_index("at", expireAfterSeconds=NOTIFICATION_TTL)
+        _indexed.add(db.name)
+
+
+def notify(collection, team, message, session=None):
+    """Adds a message to team's feed, inside session's transaction (or a transaction of its own).
+
+    The counter bump and the entry commit together, so a session woken by the bump
+    (through the live-sync watcher) always finds the entry, and two notifiers
+    bumping the same counter are serialized by the transaction's write conflict.
+    """
+    if session is None:
+        with collection.database.client.start_session() as own_session:
+            return own_session.with_transaction(lambda own_session: notify(collection, team, message, own_session))
+
+    db = collection.database
+    _ensure_indexes(db)
+    doc = collection.find_one_and_update(
+        {"_id": team},
+        # Also drops the unbounded array messages used to be pushed onto
+        {"$inc": {"notification_seq": 1, **BUMP_VERSION}, "$unset": {"notifications": ""}},
+        projection={"notification_seq": 1},
+        return_document=ReturnDocument.AFTER,
+        session=session,
+    )
+    if doc is None:
+        return None
+    db[NOTIFICATIONS_COLLECTION].insert_one({
+        "game": collection.name,
+        "team": team,
+        "seq": doc["notification_seq"],
+        "message": message,
+        "at": datetime.datetime.now(datetime.timezone.utc),
+    }, session=session)
+    return doc["notification_seq"]
+
+
+def fetch_since(collection, team, cursor):
+    """Returns team's messages newer than cursor, oldest first, as (seq, message) pairs."""
+    entries = collection.database[NOTIFICATIONS_COLLECTION].find(
+        {"game": collection.name, "team": team, "seq": {"$gt": cursor}},
+        {"seq": 1, "message": 1},
+        sort=[("seq", 1)],
+        limit=MAX_NOTIFICATIONS_PER_READ,
+    )
+    return [(entry["seq"], entry["message"]) for entry in entries]
@@ -0,0 +1,205 @@
+"""A service worker that keeps the map working in dead spots, served next to the Streamlit server.
+
+The worker (pwa/service-worker.js) precaches the map tiles covering the zones in
+zones.kml from the map's min zoom up to PRECACHE_MAX_ZOOM, plus the logo and the
+manifest, and serves tiles cache-first: a tile that is in the cache is answered
+from it straight away and refreshed in the background once it is older than
+REVALIDATE_AFTER. Tiles fetched while playing go into a second cache that is
+capped at MAX_RUNTIME_TILES entries, evicting the oldest first.
+
+Streamlit's static file serving answers .js files as text/plain, which browsers
+refuse to run as a service worker, and a worker can only control pages under the
+path it is served from. So with OFFLINE=1, start_server() runs a small server on
+OFFLINE_PORT for the worker (with Service-Worker-Allowed: /), the manifest and the
+logo. A worker must come from the page's own origin, so the reverse proxy in front
+of Streamlit (browsers only allow service workers over https or on localhost) has
+to send WORKER_PATH, MANIFEST_URL and IMAGES_URL, under the server's baseUrlPath,
+to that port and everything else to Streamlit.
+
+To try it without MapTiler, point the map at the stand-in tile server:
+
+    python benchmarks/tile_server.py --port 8600 &
+    TILE_URL="http://127.0.0.1:8600/{z}/{x}/{y}.png?key=" OFFLINE=1 streamlit run ottawa_game.py
+"""
+import hashlib
+import json
+import math
+import mimetypes
+import os
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import streamlit.components.v1 as components
+from streamlit import config
+
+PWA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pwa")
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "manifest.json")
+WORKER_PATH = "/service-worker.js"
+MANIFEST_URL = "/manifest.webmanifest"
+IMAGES_URL = "/pwa/images/"
+LOGO = "kinneret_logo.png"
+
+OFFLINE_ENABLED = os.environ.get("OFFLINE", "0") == "1"  # needs the reverse proxy routes above
+OFFLINE_HOST = os.environ.get("OFFLINE_HOST", "127.0.0.1")
+OFFLINE_PORT = int(os.environ.get("OFFLINE_PORT", "8504"))
+PRECACHE_MIN_ZOOM = 13  # the tile layer's min_zoom
+PRECACHE_MAX_ZOOM = int(os.environ.get("OFFLINE_MAX_ZOOM", "17"))  # how far players zoom in on the street
+PRECACHE_MARGIN = 1  # extra tiles around the zones on every side, for a screen centred on an edge
+MAX_RUNTIME_TILES = int(os.environ.get("OFFLINE_MAX_TILES", "1500"))  # roughly 30 MB of tiles
+REVALIDATE_AFTER = 7 * 24 * 3600  # seconds before a cached tile is refreshed in the background
+
+_server_lock = threading.Lock()
+_worker_config = {}
+_server_started = False
+
+
+def tile_xy(lat, lon, zoom):
+    """The x, y of the web-mercator tile containing (lat, lon) at zoom."""
+    n = 2 ** zoom
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def precache_tiles(bounds, min_zoom=PRECACHE_MIN_ZOOM, max_zoom=PRECACHE_MAX_ZOOM, margin=PRECACHE_MARGIN):
+    """Every (z, x, y) covering bounds (min_lon, min_lat, max_lon, max_lat) from min_zoom to max_zoom."""
+    min_lon, min_lat, max_lon, max_lat = bounds
+    tiles = []
+    for zoom in range(min_zoom, max_zoom + 1):
+        last = 2 ** zoom - 1
+        # Tile rows count down from the north, so the top-left tile is at (max_lat, min_lon)
+        left, top = tile_xy(max_lat, min_lon, zoom)
+        right, bottom = tile_xy(min_lat, max_lon, zoom)
+        for x in range(max(left - margin, 0), min(right + margin, last) + 1):
+            for y in range(max(top - margin, 0), min(bottom + margin, last) + 1):
+                tiles.append((zoom, x, y))
+    return tiles
+
+
+@lru_cache(maxsize=8)
+def worker_config(tile_url, bounds, base_path=""):
+    """What the service worker needs to know, rendered into its script."""
+    tiles = precache_tiles(bounds)
+    config_without_version = {
+        "tile_url": tile_url,
+        "tiles": tiles,
+        "assets": [base_path + MANIFEST_URL, base_path + IMAGES_URL + LOGO],
+        "static_prefix": base_path + "/static/",
+        "max_runtime_tiles": MAX_RUNTIME_TILES,
+        "revalidate_after_ms": REVALIDATE_AFTER * 1000,
+    }
+    # The version names the precache, so leave the key out of it: a new key shouldn't throw the tiles away
+    versioned = dict(config_without_version, tile_url=tile_url.split("?", 1)[0])
+    version = hashlib.sha1(json.dumps(versioned, sort_keys=True).encode()).hexdigest()[:12]
+    return dict(config_without_version, version=version)
+
+
+def worker_script(worker_settings):
+    with open(os.path.join(PWA_DIR, "service-worker.js")) as f:
+        return f.read().replace("__CONFIG__", json.dumps(worker_settings, separators=(",", ":")))
+
+
+def manifest(base_path=""):
+    """manifest.json with its icon pointing at the logo served next to the worker."""
+    with open(MANIFEST_PATH) as f:
+        app_manifest = json.load(f)
+    for icon in app_manifest.get("icons", []):
+        icon["src"] = base_path + IMAGES_URL + os.path.basename(icon["src"])
+    app_manifest["start_url"] = base_path + "/"
+    app_manifest["scope"] = base_path + "/"
+    return app_manifest
+
+
+class OfflineHandler(BaseHTTPRequestHandler):
+    """The worker, the manifest and the logo; anything else is a 404."""
+
+    def do_GET(self):
+        prefix = _worker_config["base_path"]
+        path = self.path.split("?", 1)[0]
+        if path == prefix + WORKER_PATH:
+            # Browsers check for a new worker on every navigation; let them, rather than a stale HTTP cache
+            body = worker_script(_worker_config["settings"]).encode()
+            self._send(body, "text/javascript; charset=utf-8", {"Service-Worker-Allowed": _worker_config["scope"]})
+        elif path == prefix + MANIFEST_URL:
+            self._send(json.dumps(manifest(prefix)).encode(), "application/manifest+json")
+        elif path == prefix + IMAGES_URL + LOGO:
+            with open(os.path.join(IMAGES_DIR, LOGO), "rb") as f:
+                self._send(f.read(), mimetypes.guess_type(LOGO)[0], cache_control="public, max-age=86400")
+        else:
+            self.send_error(404)
+
+    def _send(self, body, content_type, headers=None, cache_control="no-cache"):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", cache_control)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def base_path():
+    """The server's baseUrlPath as a prefix for our routes: "" or "/<path>"."""
+    base = config.get_option("server.baseUrlPath").strip("/")
+    return "/" + base if base else ""
+
+
+def start_server(tile_url, bounds):
+    """Serves the worker for this tile template and play area on OFFLINE_PORT.
+
+    The server starts on the first call; later calls only change the worker it
+    serves, which browsers pick up on their next update check (e.g. after a new
+    key or zones.kml).
+    """
+    global _server_started
+    prefix = base_path()
+    settings = worker_config(tile_url, bounds, prefix)
+    with _server_lock:
+        _worker_config.update(settings=settings, base_path=prefix, scope=prefix + "/")
+        if _server_started:
+            return
+        _server_started = True
+        try:
+            server = ThreadingHTTPServer((OFFLINE_HOST, OFFLINE_PORT), OfflineHandler)
+        except OSError:
+            # Another process (e.g. an older server still shutting down) holds the port
+            return
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="offline-server", daemon=True).start()
+
+
+def offline_support():
+    """Registers the service worker from the page and asks it to precache the play area's tiles.
+
+    start_server() must have been called in this process first.
+    """
+    if not OFFLINE_ENABLED:
+        return
+    components.html(_registration_html(_worker_config["base_path"]), height=0)
+
+
+def _registration_html(base_path):
+    return f"""
+    <script>
+      // Runs in a same-origin iframe; the worker belongs to the page around it
+      const page = window.parent;
+      if (page.navigator.serviceWorker && page.isSecureContext) {{
+        if (!page.document.querySelector('link[rel="manifest"]')) {{
+          const link = page.document.createElement("link");
+          link.rel = "manifest";
+          link.href = "{base_path}{MANIFEST_URL}";
+          page.document.head.appendChild(link);
+        }}
+        page.navigator.serviceWorker.register("{base_path}{WORKER_PATH}", {{ scope: "{base_path}/" }})
+          .then(() => page.navigator.serviceWorker.ready)
+          .then((registration) => registration.active.postMessage({{ type: "precache" }}))
+          .catch((error) => console.warn("Offline map unavailable:", error));
+      }}
+    </script>
+    """
@@ -0,0 +1,169 @@
+// Keeps the game map working in dead spots. Served by offline.py, which fills in CONFIG.
+//
+// Map tiles are answered cache-first. The tiles covering the zones are precached
+// when the page asks for it (and again on later visits, skipping what is already
+// there); a cached tile older than revalidate_after_ms is still answered from the
+// cache and refreshed in the background. Tiles outside the precached set go into a
+// runtime cache capped at max_runtime_tiles entries, oldest out first. Streamlit's
+// content-hashed frontend bundles and the logo/manifest are cached the same way.
+// Tiles are cached without their query string, so a new API key keeps the cache.
+
+const CONFIG = __CONFIG__;
+
+const PRECACHE = "tiles-precache-" + CONFIG.version;
+const RUNTIME_TILES = "tiles-runtime";
+const ASSETS = "assets-" + CONFIG.version;
+const STATIC = "streamlit-static";
+const CURRENT_CACHES = [PRECACHE, RUNTIME_TILES, ASSETS, STATIC];
+const MAX_STATIC_ENTRIES = 200;
+const PRECACHE_CONCURRENCY = 4;
+const CACHED_AT_HEADER = "X-Cached-At";
+// The tile proxy's template is a path on this server
+const TILE_URL = CONFIG.tile_url.startsWith("/") ? self.location.origin + CONFIG.tile_url : CONFIG.tile_url;
+const TILE_PREFIX = TILE_URL.split("{z}")[0];
+
+function tileUrl(z, x, y) {
+  return TILE_URL.replace("{z}", z).replace("{x}", x).replace("{y}", y);
+}
+
+function withoutQuery(url) {
+  const parsed = new URL(url);
+  return parsed.origin + parsed.pathname;
+}
+
+// Fetches url and stores a copy under key, stamped with when it was fetched
+async function fetchAndStore(cache, url, key) {
+  const response = await fetch(url, { mode: "cors", credentials: "omit" });
+  if (!response.ok) return response;
+  const headers = new Headers(response.headers);
+  headers.set(CACHED_AT_HEADER, String(Date.now()));
+  const stored = new Response(await response.blob(), { status: response.status, statusText: response.statusText, headers: headers });
+  await cache.put(key, stored.clone());
+  return stored;
+}
+
+function isStale(response) {
+  const cachedAt = Number(response.headers.get(CACHED_AT_HEADER) || 0);
+  return Date.now() - cachedAt > CONFIG.revalidate_after_ms;
+}
+
+const trimming = {};
+
+// Deletes the oldest entries of cacheName beyond maxEntries; one trim per cache at a time
+function trim(cacheName, maxEntries) {
+  if (!trimming[cacheName]) {
+    trimming[cacheName] = (async () => {
+      const cache = await caches.open(cacheName);
+      const keys = await cache.keys();
+      for (const key of keys.slice(0, Math.max(0, keys.length - maxEntries))) {
+        await cache.delete(key);
+      }
+    })().finally(() => {
+      trimming[cacheName] = null;
+    });
+  }
+  return trimming[cacheName];
+}
+
+async function tileResponse(event) {
+  const url = event.request.url;
+  const key = withoutQuery(url);
+  for (const cacheName of [PRECACHE, RUNTIME_TILES]) {
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(key);
+    if (cached) {
+      if (isStale(cached)) {
+        // Re-putting also moves the tile to the back of the eviction order
+        event.waitUntil(fetchAndStore(cache, url, key).catch(() => null));
+      }
+      return cached;
+    }
+  }
+  try {
+    const response = await fetchAndStore(await caches.open(RUNTIME_TILES), url, key);
+    event.waitUntil(trim(RUNTIME_TILES, CONFIG.max_runtime_tiles));
+    return response;
+  } catch (error) {
+    // Offline, or a tile server without CORS: let the browser try the request as it was made
+    return fetch(event.request);
+  }
+}
+
+async function cacheFirst(event, cacheName, maxEntries) {
+  const cache = await caches.open(cacheName);
+  const cached = await cache.match(event.request);
+  if (cached) return cached;
+  const response = await fetch(event.request);
+  if (response.ok) {
+    event.waitUntil(cache.put(event.request, response.clone()).then(() => maxEntries && trim(cacheName, maxEntries)));
+  }
+  return response;
+}
+
+let precaching = null;
+
+async function precacheTiles() {
+  const cache = await caches.open(PRECACHE);
+  const queue = CONFIG.tiles.slice();
+  async function next() {
+    while (queue.length > 0) {
+      const [z, x, y] = queue.shift();
+      const url = tileUrl(z, x, y);
+      const key = withoutQuery(url);
+      if (await cache.match(key)) continue;
+      try {
+        await fetchAndStore(cache, url, key);
+      } catch (error) {
+        // No signal right now; the next visit picks up where this one stopped
+        return;
+      }
+    }
+  }
+  await Promise.all(Array.from({ length: PRECACHE_CONCURRENCY }, next));
+}
+
+self.addEventListener("install", (event) => {
+  event.waitUntil(
+    caches.open(ASSETS)
+      // One by one, so a missing asset doesn't stop the worker from installing
+      .then((cache) => Promise.all(CONFIG.assets.map((asset) => cache.add(asset).catch(() => null))))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener("activate", (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((names) => Promise.all(
+        names
+          .filter((name) => (name.startsWith("tiles-precache-") || name.startsWith("assets-")) && !CURRENT_CACHES.includes(name))
+          .map((name) => caches.delete(name))
+      ))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener("message", (event) => {
+  if (event.data && event.data.type === "precache") {
+    precaching = precaching || precacheTiles().finally(() => {
+      precaching = null;
+    });
+    event.waitUntil(precaching);
+  }
+});
+
+self.addEventListener("fetch", (event) => {
+  const request = event.request;
+  if (request.method !== "GET") return;
+  if (request.url.startsWith(TILE_PREFIX)) {
+    event.respondWith(tileResponse(event));
+    return;
+  }
+  const url = new URL(request.url);
+  if (url.origin !== self.location.origin) return;
+  if (url.pathname.startsWith(CONFIG.static_prefix)) {
+    event.respondWith(cacheFirst(event, STATIC, MAX_STATIC_ENTRIES));
+  } else if (CONFIG.assets.includes(url.pathname)) {
+    event.respondWith(cacheFirst(event, ASSETS, 0));
+  }
+});
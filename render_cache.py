@@ -0,0 +1,22 @@
+from functools import lru_cache
+
+# Every memoized fragment renderer in the process, by name, so their hit rates can be reported together
+RENDER_CACHES = {}
+
+
+def render_cache(name, maxsize):
+    """Memoizes an HTML/markdown fragment renderer on its (hashable) content inputs.
+
+    Entries are evicted least-recently-used once maxsize is reached. The cache is
+    shared by every session in the process.
+    """
+    def decorator(render):
+        cached = lru_cache(maxsize=maxsize)(render)
+        RENDER_CACHES[name] = cached
+        return cached
+    return decorator
+
+
+def render_cache_stats():
+    """Returns {name: {"hits", "misses", "maxsize", "currsize"}} for every render cache."""
+    return {name: cached.cache_info()._asdict() for name, cached in RENDER_CACHES.items()}
@@ -0,0 +1,79 @@
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+TEAMS = ("orange", "pink")
+ZONE_FIELDS = tuple(f"zone_{zone_num}" for zone_num in range(1, 10))
+# The games registry (see games.py), kept here so events can use it without importing games
+REGISTRY_COLLECTION = "games"
+# Every write to a team document also increments its "version" field, in the same
+# update, so readers such as the leaderboard can tell which documents changed
+BUMP_VERSION = {"version": 1}
+
+# Fields each screen reads; anything else stays on the server. The map only needs the zone
+# totals, the team panel and curse screens everything but the hand, the play screen the lot.
+SCREEN_FIELDS = {"map": ZONE_FIELDS}
+SCREEN_FIELDS["team"] = SCREEN_FIELDS["map"] + ("balance", "completed_challenges", "active_curses", "gold_rush_active", "notification_seq")
+SCREEN_FIELDS["play"] = SCREEN_FIELDS["team"] + ("hand",)
+
+
+@dataclass(frozen=True)
+class TeamSnapshot:
+    """Read-only view of one team's document as of the start of the rerun."""
+
+    name: str
+    balance: int = 0
+    zones: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+    completed_challenges: tuple = ()
+    hand: tuple = ()
+    active_curses: tuple = ()
+    gold_rush_active: bool = False
+    notification_seq: int = 0
+
+    @classmethod
+    def from_document(cls, doc):
+        zones = {int(key[len("zone_"):]): value for key, value in doc.items() if key.startswith("zone_")}
+        return cls(
+            name=doc["_id"],
+            balance=doc.get("balance", 0),
+            zones=MappingProxyType(zones),
+            completed_challenges=tuple(doc.get("completed_challenges", ())),
+            hand=tuple(doc.get("hand", ())),
+            active_curses=tuple(doc.get("active_curses", ())),
+            gold_rush_active=doc.get("gold_rush_active", False),
+            notification_seq=doc.get("notification_seq", 0),
+        )
+
+    def zone_points(self, zone_number):
+        return self.zones.get(zone_number, 0)
+
+
+@dataclass(frozen=True)
+class GameSnapshot:
+    """Both teams' state, fetched together in one round trip."""
+
+    orange: TeamSnapshot = None
+    pink: TeamSnapshot = None
+
+    def team(self, name):
+        return self.orange if name == "orange" else self.pink
+
+    def opponent(self, name):
+        return self.pink if name == "orange" else self.orange
+
+
+def load_snapshot(collection, screen="play", team=None):
+    """Fetches both team documents in one round trip, projected down to what screen needs.
+
+    With team, only that team's document gets screen's fields; the other team's
+    only colours the map, so it gets the "map" fields.
+    """
+    team_filter = {"_id": {"$in": list(TEAMS)}}
+    if team is None:
+        docs = collection.find(team_filter, dict.fromkeys(SCREEN_FIELDS[screen], 1))
+    else:
+        projection = dict.fromkeys(SCREEN_FIELDS["map"], 1)
+        for field in SCREEN_FIELDS[screen]:
+            projection.setdefault(field, {"$cond": [{"$eq": ["$_id", team]}, f"${field}", "$$REMOVE"]})
+        docs = collection.aggregate([{"$match": team_filter}, {"$project": projection}])
+    teams = {doc["_id"]: TeamSnapshot.from_document(doc) for doc in docs}
+    return GameSnapshot(orange=teams.get("orange"), pink=teams.get("pink"))
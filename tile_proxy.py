@@ -0,0 +1,409 @@
+"""A caching map tile proxy, so phones share one copy of each tile and never see the MapTiler key.
+
+Tiles are kept in an MBTiles file (SQLite) and fetched from UPSTREAM_URL only on
+a miss. Concurrent requests for a tile that is being fetched wait for that one
+fetch instead of starting their own. Only tiles from zoom PREWARM_MIN_ZOOM to
+MAX_ZOOM that lie within FETCH_MARGIN metres of the play area are fetched, so a
+client can't spend the MapTiler quota on the rest of the world. The play area
+can be prewarmed ahead of a game, and hits, misses and coalesced requests are
+counted.
+
+With TILE_PROXY=1 the app starts the proxy in a thread on TILE_PROXY_PORT,
+prewarms the zones in the background and points the map at PROXY_PATH instead of
+at MapTiler; PROXY_PATH + "stats" reports the counters. The reverse proxy in front
+of Streamlit sends PROXY_PATH, under the server's baseUrlPath, to that port (or set
+TILE_PROXY_URL to wherever phones can reach it). It also runs on its own, reading
+the key from MAPTILER_KEY:
+
+    python tile_proxy.py --port 8503
+    python tile_proxy.py --prewarm-only --max-zoom 18
+    python tile_proxy.py --upstream "http://127.0.0.1:8600/{z}/{x}/{y}.png?key={key}"  # benchmarks/tile_server.py
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from map_view import TILE_URL
+from offline import PRECACHE_MARGIN, base_path, precache_tiles, tile_xy
+from zones import METRES_PER_DEGREE_LAT, get_zone_store
+
+TILE_PROXY_ENABLED = os.environ.get("TILE_PROXY", "0") == "1"
+UPSTREAM_URL = os.environ.get("TILE_UPSTREAM", TILE_URL + "{key}")
+CACHE_PATH = os.environ.get("TILE_CACHE", os.path.join(os.getcwd(), "data", "tiles.mbtiles"))
+# "min_lon,min_lat,max_lon,max_lat" to prewarm instead of the zones' bounds
+PREWARM_BBOX = os.environ.get("TILE_PREWARM_BBOX")
+PREWARM_ON_START = os.environ.get("TILE_PREWARM", "1") == "1"
+PREWARM_MIN_ZOOM = 13  # also the lowest zoom served, the map's min_zoom
+PREWARM_MAX_ZOOM = int(os.environ.get("TILE_PREWARM_MAX_ZOOM", "17"))
+MAX_ZOOM = 22  # the deepest zoom MapTiler serves
+FETCH_MARGIN = int(os.environ.get("TILE_FETCH_MARGIN", "2000"))  # metres around the play area that tiles are fetched for
+PREWARM_WORKERS = 4  # upstream fetches at a time while prewarming
+UPSTREAM_TIMEOUT = 10  # seconds
+PROXY_PATH = "/tiles/"
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8503
+PROXY_HOST = os.environ.get("TILE_PROXY_HOST", DEFAULT_HOST)
+PROXY_PORT = int(os.environ.get("TILE_PROXY_PORT", str(DEFAULT_PORT)))
+# The tile template phones use with TILE_PROXY=1 (default: PROXY_PATH on the app's own origin)
+PROXY_URL = os.environ.get("TILE_PROXY_URL")
+TILE_PATH = re.compile(r"^/(\d{1,2})/(\d{1,7})/(\d{1,7})\.png$")
+
+_proxies = {}
+_proxies_lock = threading.Lock()
+_start_lock = threading.Lock()
+_started_url = None
+
+
+class UpstreamError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class MBTilesStore:
+    """Tiles in an MBTiles file: one SQLite table keyed by zoom, column and row.
+
+    MBTiles numbers rows from the south (TMS), so y is flipped on the way in and out.
+    One connection is shared behind a lock; a lookup is a primary-key read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB,"
+                " PRIMARY KEY (zoom_level, tile_column, tile_row))"
+            )
+            self._db.executemany(
+                "INSERT OR IGNORE INTO metadata (name, value) VALUES (?, ?)",
+                [("name", "Ottawa Game tile cache"), ("format", "png"), ("type", "baselayer"), ("version", "1")],
+            )
+
+    def get(self, z, x, y):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, 2 ** z - 1 - y),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, z, x, y, data):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+                (z, x, 2 ** z - 1 - y, sqlite3.Binary(data)),
+            )
+
+    def summary(self):
+        with self._lock:
+            count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(tile_data)), 0) FROM tiles").fetchone()
+        return {"tiles": count, "bytes": size}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class _PendingTile:
+    __slots__ = ("done", "data", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.data = None
+        self.error = None
+
+
+class TileProxy:
+    """Answers tiles from the MBTiles store, fetching each missing tile from upstream exactly once.
+
+    With fetch_bounds (min_lon, min_lat, max_lon, max_lat), tiles that aren't stored
+    are only fetched for clients when they overlap those bounds or the ring of
+    tiles around them.
+    """
+
+    def __init__(self, store, upstream_url, fetch_bounds=None, timeout=UPSTREAM_TIMEOUT):
+        self.store = store
+        self.upstream_url = upstream_url
+        self.fetch_bounds = fetch_bounds
+        self.timeout = timeout
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._fetch_ranges = {}
+        # Client requests only; prewarming is counted separately so it doesn't flatter the hit rate
+        self._counts = {"requests": 0, "hits": 0, "misses": 0, "coalesced": 0, "errors": 0, "outside_area": 0, "prewarmed": 0}
+        self._upstream_seconds = 0.0
+        self._upstream_fetches = 0
+
+    def _count(self, name, prewarming=False):
+        if prewarming and name != "prewarmed":
+            return
+        with self._lock:
+            self._counts[name] += 1
+
+    def _fetchable(self, z, x, y):
+        if self.fetch_bounds is None:
+            return True
+        ranges = self._fetch_ranges.get(z)
+        if ranges is None:
+            min_lon, min_lat, max_lon, max_lat = self.fetch_bounds
+            # Tile rows count down from the north, so the top-left tile is at (max_lat, min_lon)
+            left, top = tile_xy(max_lat, min_lon, z)
+            right, bottom = tile_xy(min_lat, max_lon, z)
+            # Plus the ring of tiles the service worker precaches around the zones
+            ranges = self._fetch_ranges[z] = (left - PRECACHE_MARGIN, right + PRECACHE_MARGIN, top - PRECACHE_MARGIN, bottom + PRECACHE_MARGIN)
+        left, right, top, bottom = ranges
+        return left <= x <= right and top <= y <= bottom
+
+    def get(self, z, x, y, prewarming=False):
+        """The tile's PNG bytes. Raises UpstreamError when it isn't cached and upstream can't supply it."""
+        # Checked before 2 ** z, which a made-up zoom would make huge
+        if not PREWARM_MIN_ZOOM <= z <= MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+            raise UpstreamError(404, "No such tile")
+        self._count("requests", prewarming)
+        data = self.store.get(z, x, y)
+        if data is not None:
+            self._count("hits", prewarming)
+            return data
+        # Prewarming asks for its own bounds; it's the clients that mustn't roam
+        if not prewarming and not self._fetchable(z, x, y):
+            self._count("outside_area", prewarming)
+            raise UpstreamError(404, "Outside the play area")
+
+        key = (z, x, y)
+        with self._lock:
+            pending = self._pending.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._pending[key] = _PendingTile()
+        if not leader:
+            self._count("coalesced", prewarming)
+            if not pending.done.wait(self.timeout * 2):
+                raise UpstreamError(504, "Timed out waiting for the tile")
+            if pending.error is not None:
+                raise pending.error
+            return pending.data
+
+        try:
+            # Another request may have stored it between our read and taking over the fetch
+            data = self.store.get(z, x, y)
+            if data is None:
+                data = self._fetch(z, x, y)
+                self.store.put(z, x, y, data)
+                self._count("prewarmed" if prewarming else "misses")
+            else:
+                self._count("hits", prewarming)
+            pending.data = data
+            return data
+        except UpstreamError as e:
+            pending.error = e
+            self._count("errors", prewarming)
+            raise
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.done.set()
+
+    def _fetch(self, z, x, y):
+        url = self.upstream_url.replace("{z}", str(z)).replace("{x}", str(x)).replace("{y}", str(y))
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=self.timeout) as response:
+                data = response.read()
+        except urllib.error.HTTPError as e:
+            # Upstream's own 404s pass through; anything else is its problem, not the client's
+            raise UpstreamError(404 if e.code == 404 else 502, f"Upstream answered {e.code}")
+        except (urllib.error.URLError, OSError) as e:
+            raise UpstreamError(502, f"Upstream unreachable: {e}")
+        with self._lock:
+            self._upstream_fetches += 1
+            self._upstream_seconds += time.perf_counter() - started
+        return data
+
+    def stats(self):
+        """Counters since start-up, the hit rate and what the store holds."""
+        with self._lock:
+            counts = dict(self._counts)
+            upstream_seconds = self._upstream_seconds
+            counts["upstream_fetches"] = self._upstream_fetches
+        # Coalesced requests waited for a fetch, so only store hits count as hits
+        counts["hit_rate"] = round(counts["hits"] / counts["requests"], 4) if counts["requests"] else None
+        counts["upstream_mean_ms"] = round(upstream_seconds / counts["upstream_fetches"] * 1e3, 2) if counts["upstream_fetches"] else None
+        counts["store"] = self.store.summary()
+        return counts
+
+    def prewarm(self, bounds, min_zoom=PREWARM_MIN_ZOOM, max_zoom=PREWARM_MAX_ZOOM, workers=PREWARM_WORKERS):
+        """Fetches every tile covering bounds (min_lon, min_lat, max_lon, max_lat) that isn't stored yet."""
+        tiles = precache_tiles(bounds, min_zoom, max_zoom, margin=PRECACHE_MARGIN)
+        missing = [tile for tile in tiles if self.store.get(*tile) is None]
+
+        def fetch(tile):
+            try:
+                self.get(*tile, prewarming=True)
+                return True
+            except UpstreamError:
+                return False
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tile-prewarm") as pool:
+            fetched = sum(pool.map(fetch, missing))
+        return {"tiles": len(tiles), "already_stored": len(tiles) - len(missing), "fetched": fetched, "failed": len(missing) - fetched}
+
+
+def get_tile_proxy(map_tiler_key, cache_path=CACHE_PATH, upstream_url=UPSTREAM_URL, play_area=None):
+    """The proxy shared by every session in the process, for this cache file and upstream.
+
+    Clients' misses are only fetched within FETCH_MARGIN of play_area (default: prewarm_bounds()).
+    """
+    upstream = upstream_url.replace("{key}", map_tiler_key)
+    with _proxies_lock:
+        proxy = _proxies.get((cache_path, upstream))
+        if proxy is None:
+            fetch_bounds = expand_bounds(play_area or prewarm_bounds(), FETCH_MARGIN)
+            proxy = _proxies[(cache_path, upstream)] = TileProxy(MBTilesStore(cache_path), upstream, fetch_bounds)
+        return proxy
+
+
+def parse_bbox(text):
+    """"min_lon,min_lat,max_lon,max_lat" -> a bounds tuple."""
+    bounds = tuple(float(part) for part in text.split(","))
+    if len(bounds) != 4:
+        raise ValueError("A bbox is min_lon,min_lat,max_lon,max_lat")
+    return bounds
+
+
+def prewarm_bounds():
+    return parse_bbox(PREWARM_BBOX) if PREWARM_BBOX else get_zone_store().total_bounds
+
+
+def expand_bounds(bounds, margin):
+    """bounds grown by margin metres on every side."""
+    min_lon, min_lat, max_lon, max_lat = bounds
+    lat_margin = margin / METRES_PER_DEGREE_LAT
+    lon_margin = margin / (METRES_PER_DEGREE_LAT * math.cos(math.radians((min_lat + max_lat) / 2)))
+    return (max(min_lon - lon_margin, -180), max(min_lat - lat_margin, -85), min(max_lon + lon_margin, 180), min(max_lat + lat_margin, 85))
+
+
+def map_tile_url(map_tiler_key):
+    """The tile template for the map: the proxy's when TILE_PROXY=1, otherwise MapTiler's.
+
+    The proxy server starts (and starts prewarming) the first time this is called.
+    """
+    global _started_url
+    if not TILE_PROXY_ENABLED:
+        return TILE_URL + map_tiler_key
+    with _start_lock:
+        if _started_url is None:
+            prefix = base_path() + PROXY_PATH
+            proxy = get_tile_proxy(map_tiler_key)
+            try:
+                server = make_server(proxy, PROXY_HOST, PROXY_PORT, prefix)
+            except OSError:
+                # Another process (e.g. an older server still shutting down) holds the port
+                server = None
+            if server is not None:
+                threading.Thread(target=server.serve_forever, name="tile-proxy", daemon=True).start()
+                if PREWARM_ON_START:
+                    threading.Thread(target=proxy.prewarm, args=(prewarm_bounds(),), name="tile-prewarm", daemon=True).start()
+            _started_url = PROXY_URL or prefix + "{z}/{x}/{y}.png"
+        return _started_url
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        # Inside the app, the reverse proxy passes on the full PROXY_PATH URL
+        if self.server.prefix and path.startswith(self.server.prefix):
+            path = path[len(self.server.prefix) - 1:]
+        if path == "/stats":
+            self._send(200, "application/json", json.dumps(self.server.proxy.stats()).encode())
+            return
+        match = TILE_PATH.match(path)
+        if match is None:
+            self._send(404, "text/plain", b"Not found")
+            return
+        try:
+            data = self.server.proxy.get(*(int(part) for part in match.groups()))
+        except UpstreamError as e:
+            self._send(e.status, "text/plain", str(e).encode())
+            return
+        self._send(200, "image/png", data, cache_control="public, max-age=86400")
+
+    def _send(self, status, content_type, body, cache_control="no-cache"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", cache_control)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ProxyServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # A page load asks for a screenful of tiles at once; the default backlog of 5 drops connections
+    request_queue_size = 128
+
+
+def make_server(proxy, host=DEFAULT_HOST, port=DEFAULT_PORT, prefix=""):
+    """A server for proxy's tiles at /{z}/{x}/{y}.png, or under prefix (ending in "/") as well."""
+    server = ProxyServer((host, port), ProxyHandler)
+    server.proxy = proxy
+    server.prefix = prefix
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve map tiles from an MBTiles cache, fetching misses upstream.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--cache", default=CACHE_PATH, help="the MBTiles file")
+    parser.add_argument("--upstream", default=UPSTREAM_URL, help="tile URL template; {key} is replaced by MAPTILER_KEY")
+    parser.add_argument("--prewarm", action="store_true", help="fetch the bbox's missing tiles before serving")
+    parser.add_argument("--prewarm-only", action="store_true", help="prewarm, print the result and exit")
+    parser.add_argument("--bbox", type=parse_bbox, help="min_lon,min_lat,max_lon,max_lat to prewarm and fetch for (default: the zones)")
+    parser.add_argument("--min-zoom", type=int, default=PREWARM_MIN_ZOOM)
+    parser.add_argument("--max-zoom", type=int, default=PREWARM_MAX_ZOOM)
+    args = parser.parse_args()
+    if not PREWARM_MIN_ZOOM <= args.min_zoom <= args.max_zoom <= MAX_ZOOM:
+        parser.error(f"zooms must satisfy {PREWARM_MIN_ZOOM} <= --min-zoom <= --max-zoom <= {MAX_ZOOM}")
+
+    key = os.environ.get("MAPTILER_KEY", "")
+    if "{key}" in args.upstream and not key:
+        raise SystemExit("Set MAPTILER_KEY, or pass an --upstream without {key}")
+    proxy = get_tile_proxy(key, args.cache, args.upstream, args.bbox)
+
+    if args.prewarm or args.prewarm_only:
+        result = proxy.prewarm(args.bbox or prewarm_bounds(), args.min_zoom, args.max_zoom)
+        print(json.dumps(result))
+        if args.prewarm_only:
+            return
+
+    server = make_server(proxy, args.host, args.port)
+    print(f"Tile proxy listening on http://{args.host}:{args.port}/{{z}}/{{x}}/{{y}}.png")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        proxy.store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Optional timing spans around the slow parts of a rerun, exported as Prometheus text.
+
+Off unless TRACING=1, in which case span() costs one flag check and hands back a
+shared do-nothing context manager. When on, every span's duration goes into an
+in-process histogram labelled with the phase, game (the first MAX_GAME_LABELS
+games, then "$other"), team and UI state, and the histograms are served as
+Prometheus text on http://127.0.0.1:TRACING_PORT/metrics (and written to
+TRACING_FILE every FILE_EXPORT_INTERVAL seconds if that is set):
+
+    TRACING=1 streamlit run ottawa_game.py
+    curl -s localhost:9464/metrics
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from render_cache import render_cache_stats
+
+TRACING_ENABLED = os.environ.get("TRACING", "0") == "1"
+TRACING_HOST = os.environ.get("TRACING_HOST", "127.0.0.1")
+TRACING_PORT = int(os.environ.get("TRACING_PORT", "9464"))  # 0 turns the endpoint off
+TRACING_FILE = os.environ.get("TRACING_FILE")
+FILE_EXPORT_INTERVAL = 5
+# Upper bounds in seconds, from a cached lookup up to a cold KML parse
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRIC_NAME = "ottawa_game_rerun_phase_seconds"
+LABELS = ("phase", "game", "team", "state")
+# Anyone can start a game by typing a new id, so only this many games get their own
+# label; spans from the rest share OTHER_GAME, keeping the series count bounded.
+# Game ids can't contain "$" (see games.validate_game_id), so no real game gets this label.
+MAX_GAME_LABELS = int(os.environ.get("TRACING_MAX_GAMES", "50"))
+OTHER_GAME = "$other"
+
+_DISABLED = nullcontext()
+_histograms = {}
+_histograms_lock = threading.Lock()
+_exporters_started = False
+_labelled_games = set()
+_labelled_games_lock = threading.Lock()
+
+
+class Histogram:
+    """Cumulative latency counts for one phase and set of tags, in BUCKETS plus +Inf."""
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+class _Span:
+    __slots__ = ("key", "started")
+
+    def __init__(self, key):
+        self.key = key
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        # Also recorded when the block ends in st.rerun() / st.stop(), which raise
+        observe(self.key, time.perf_counter() - self.started)
+        return False
+
+
+def tags(game=None, team=None, state=None):
+    """The labels shared by every span of one rerun, or None when tracing is off."""
+    if not TRACING_ENABLED:
+        return None
+    return (_game_label(game), team or "", state or "")
+
+
+def _game_label(game):
+    """game itself for the first MAX_GAME_LABELS games seen, OTHER_GAME after that."""
+    if not game or game in _labelled_games:
+        return game or ""
+    with _labelled_games_lock:
+        if len(_labelled_games) < MAX_GAME_LABELS:
+            _labelled_games.add(game)
+            return game
+    return OTHER_GAME
+
+
+def span(phase, rerun_tags):
+    """Times the with-block as phase of the current rerun."""
+    if not TRACING_ENABLED:
+        return _DISABLED
+    return _Span((phase,) + rerun_tags)
+
+
+def observe(key, seconds):
+    with _histograms_lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+            _start_exporters()
+        histogram.observe(seconds)
+
+
+def prometheus_text():
+    """Renders every histogram (and the render caches' hit counts) in the Prometheus text format."""
+    with _histograms_lock:
+        rows = [(key, list(h.counts), h.total, h.count) for key, h in sorted(_histograms.items())]
+
+    lines = [
+        f"# HELP {METRIC_NAME} Time spent in each phase of a script rerun.",
+        f"# TYPE {METRIC_NAME} histogram",
+    ]
+    for key, counts, total, count in rows:
+        labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(LABELS, key))
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS + ("+Inf",), counts):
+            cumulative += bucket_count
+            lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"{METRIC_NAME}_sum{{{labels}}} {total}")
+        lines.append(f"{METRIC_NAME}_count{{{labels}}} {count}")
+
+    lines.append("# HELP ottawa_game_render_cache_requests_total Lookups in the fragment render caches.")
+    lines.append("# TYPE ottawa_game_render_cache_requests_total counter")
+    for name, stats in sorted(render_cache_stats().items()):
+        lines.append(f'ottawa_game_render_cache_requests_total{{cache="{name}",result="hit"}} {stats["hits"]}')
+        lines.append(f'ottawa_game_render_cache_requests_total{{cache="{name}",result="miss"}} {stats["misses"]}')
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _histograms_lock:
+        _histograms.clear()
+    with _labelled_games_lock:
+        _labelled_games.clear()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_exporters():
+    # Called with _histograms_lock held, the first time anything is recorded
+    global _exporters_started
+    if _exporters_started:
+        return
+    _exporters_started = True
+    if TRACING_PORT:
+        try:
+            server = ThreadingHTTPServer((TRACING_HOST, TRACING_PORT), MetricsHandler)
+        except OSError:
+            # Another process (e.g. an older server still shutting down) holds the port
+            server = None
+        if server is not None:
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics-endpoint", daemon=True).start()
+    if TRACING_FILE:
+        threading.Thread(target=_write_file_forever, name="metrics-file", daemon=True).start()
+
+
+def _write_file_forever():
+    while True:
+        time.sleep(FILE_EXPORT_INTERVAL)
+        write_file(TRACING_FILE)
+
+
+def write_file(path):
+    """Writes the metrics to path atomically, so a collector never reads half a file."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(prometheus_text())
+    os.replace(temp_path, path)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
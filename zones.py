@@ -0,0 +1,191 @@
+import os
+import re
+import threading
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+ZONES_PATH = os.path.join(os.getcwd(), "data", "zones.kml")
+MAX_SNAP_DISTANCE = None  # metres; outside every zone, snap to the nearest one within this (None = any distance)
+
+METRES_PER_DEGREE_LAT = 111_320
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class ZoneStore:
+    """Zone geometry parsed once from the KML, with everything the map and lookups need precomputed.
+
+    Zones are keyed by the number in their KML name ("Zone 3" -> 3), not by their
+    row position in the file. Lookups run on a copy of the polygons projected to
+    local metres (equirectangular around the zones' centre, which is plenty
+    accurate at city scale) so that distances come back in metres.
+    """
+
+    def __init__(self, path, mtime):
+        self.path = path
+        self.mtime = mtime
+
+        gdf = gpd.read_file(path, driver="KML")
+        geometries = shapely.force_2d(gdf.geometry.values)
+
+        self.zone_ids = []
+        for i, name in enumerate(gdf["Name"]):
+            match = re.search(r"\d+", name or "")
+            self.zone_ids.append(int(match.group()) if match else i + 1)
+
+        self.polygons = {}
+        self.leaflet_coords = {}
+        self.centroids = {}
+        self.bounds = {}
+        for zone_id, polygon in zip(self.zone_ids, geometries):
+            shapely.prepare(polygon)
+            self.polygons[zone_id] = polygon
+            # Leaflet wants (lat, lon) pairs; the KML is (lon, lat)
+            self.leaflet_coords[zone_id] = [(y, x) for x, y in polygon.exterior.coords]
+            centroid = polygon.centroid
+            self.centroids[zone_id] = (centroid.y, centroid.x)
+            self.bounds[zone_id] = polygon.bounds
+
+        self.total_bounds = tuple(gdf.total_bounds)
+
+        min_lon, min_lat, max_lon, max_lat = self.total_bounds
+        self.origin = ((min_lat + max_lat) / 2, (min_lon + max_lon) / 2)
+        self._scale = (METRES_PER_DEGREE_LAT * float(np.cos(np.radians(self.origin[0]))), METRES_PER_DEGREE_LAT)
+
+        self._ids = np.array(self.zone_ids)
+        self._metric_polygons = shapely.transform(geometries, self._to_metres)
+        self._metric_boundaries = shapely.boundary(self._metric_polygons)
+        shapely.prepare(self._metric_polygons)
+        self._tree = shapely.STRtree(self._metric_polygons)
+
+        # Per-zone bounding boxes and boundary segments (start point, direction, 1 / squared length) for locate_many
+        self._metric_bounds = shapely.bounds(self._metric_polygons)
+        self._edges = []
+        for polygon in self._metric_polygons:
+            ring = np.asarray(polygon.exterior.coords)
+            start, direction = ring[:-1], np.diff(ring, axis=0)
+            self._edges.append((start, direction, 1 / np.maximum((direction ** 2).sum(axis=1), 1e-12)))
+
+    def __len__(self):
+        return len(self.zone_ids)
+
+    def __iter__(self):
+        return iter(self.zone_ids)
+
+    def _to_metres(self, lon_lat):
+        return (lon_lat - (self.origin[1], self.origin[0])) * np.array(self._scale)
+
+    def locate(self, lat, lon, max_distance=MAX_SNAP_DISTANCE):
+        """Returns (zone id, metres to that zone's boundary) for a point, or (None, None).
+
+        A point inside a zone gets that zone. Otherwise the STRtree finds the nearest
+        zone within max_distance.
+        """
+        if lat is None or lon is None:
+            return None, None
+
+        x = (lon - self.origin[1]) * self._scale[0]
+        y = (lat - self.origin[0]) * self._scale[1]
+        # One vectorized pass over the prepared polygons is cheaper than a tree query for a handful of zones
+        inside = np.flatnonzero(shapely.contains_xy(self._metric_polygons, x, y))
+        point = shapely.Point(x, y)
+        if len(inside):
+            i = inside[0]
+            return int(self._ids[i]), self._metric_boundaries[i].distance(point)
+
+        # shapely rejects a max_distance of 0, so that case searches everything and is filtered below
+        nearest, distances = self._tree.query_nearest(point, max_distance=max_distance or None, return_distance=True)
+        if len(nearest) == 0 or (max_distance is not None and distances[0] > max_distance):
+            return None, None
+        return int(self._ids[nearest[0]]), float(distances[0])
+
+    def stable_distance(self, lat, lon, max_distance=MAX_SNAP_DISTANCE):
+        """Metres the point can move in any direction without locate() returning another zone, or None.
+
+        locate() answers with the zone at the smallest distance (0 inside it), so the
+        answer can only change once the nearest two zones swap, which takes at least
+        half the gap between their distances, or once the nearest one crosses
+        max_distance.
+        """
+        if lat is None or lon is None:
+            return None
+
+        point = shapely.Point((lon - self.origin[1]) * self._scale[0], (lat - self.origin[0]) * self._scale[1])
+        distances = np.sort(shapely.distance(self._metric_polygons, point))
+        stable = (distances[1] - distances[0]) / 2 if len(distances) > 1 else float("inf")
+        if max_distance is not None:
+            stable = min(stable, abs(max_distance - distances[0]))
+        return float(stable)
+
+    def locate_many(self, lats, lons, max_distance=MAX_SNAP_DISTANCE):
+        """Vectorized locate() for arrays of fixes, e.g. a recorded GPS trace.
+
+        Returns (zone ids, metres to boundary) as arrays; points with no zone within
+        max_distance get -1 and nan. Python only loops over zones and their edges,
+        never over points.
+        """
+        x = (np.asarray(lons, dtype=float) - self.origin[1]) * self._scale[0]
+        y = (np.asarray(lats, dtype=float) - self.origin[0]) * self._scale[1]
+        zone_index = np.full(len(x), -1, dtype=np.intp)
+        distances = np.full(len(x), np.inf)
+
+        for i, (min_x, min_y, max_x, max_y) in enumerate(self._metric_bounds):
+            candidates = np.flatnonzero((x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y))
+            hits = candidates[shapely.contains_xy(self._metric_polygons[i], x[candidates], y[candidates])]
+            # Neighbouring zones only overlap on shared edges; the first zone keeps those points
+            hits = hits[zone_index[hits] < 0]
+            zone_index[hits] = i
+            distances[hits] = self._squared_boundary_distances(i, x[hits], y[hits])
+
+        # Snap the rest to the nearest zone, skipping zones whose bounding box is already too far away
+        outside = np.flatnonzero(zone_index < 0)
+        ox, oy = x[outside], y[outside]
+        best = np.full(len(outside), np.inf if max_distance is None else float(max(max_distance, 0)) ** 2)
+        for i, (min_x, min_y, max_x, max_y) in enumerate(self._metric_bounds):
+            box_dx = np.maximum(np.maximum(min_x - ox, ox - max_x), 0)
+            box_dy = np.maximum(np.maximum(min_y - oy, oy - max_y), 0)
+            candidates = np.flatnonzero(box_dx * box_dx + box_dy * box_dy <= best)
+            d = self._squared_boundary_distances(i, ox[candidates], oy[candidates])
+            closer = d <= best[candidates]
+            best[candidates[closer]] = d[closer]
+            zone_index[outside[candidates[closer]]] = i
+        distances[outside] = best
+
+        ids = np.where(zone_index >= 0, self._ids[zone_index], -1)
+        distances = np.sqrt(distances)
+        distances[ids < 0] = np.nan
+        return ids, distances
+
+    def _squared_boundary_distances(self, i, x, y):
+        start, direction, inverse_length2 = self._edges[i]
+        best = np.full(len(x), np.inf)
+        t = np.empty(len(x))
+        for (ax, ay), (ex, ey), k in zip(start, direction, inverse_length2):
+            px, py = x - ax, y - ay
+            # Position of the closest point along the edge, clamped to its ends
+            np.multiply(px, ex * k, out=t)
+            t += py * (ey * k)
+            np.clip(t, 0, 1, out=t)
+            px -= t * ex
+            py -= t * ey
+            px *= px
+            py *= py
+            px += py
+            np.minimum(best, px, out=best)
+        return best
+
+
+def get_zone_store(path=ZONES_PATH):
+    """Returns the process-wide store for path, re-parsing the file only when its mtime changes."""
+    mtime = os.stat(path).st_mtime_ns
+    store = _stores.get(path)
+    if store is not None and store.mtime == mtime:
+        return store
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None or store.mtime != mtime:
+            store = _stores[path] = ZoneStore(path, mtime)
+    return store